@@ -2,15 +2,24 @@ import os
 import json
 import uuid
 import re
+import asyncio
+import threading
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
 
-from ..tools.financial_data_extractor import extract_metrics_from_pdf
+from ..tools.financial_data_extractor import extract_metrics_batch, iter_metrics_batch
 from ..tools.qualitative_rag_tool import QualitativeAnalysisTool, extract_themes_and_sentiment
 from ..database.mysql_logger import log_request
+from ..utils.llm import chat, stream_chat
+from ..utils.metrics import span, record, record_error
+from ..utils.executors import run, deadline_after, check_deadline
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", 120))
+QUALITATIVE_TIMEOUT = float(os.getenv("QUALITATIVE_TIMEOUT", 60))
+SYNTHESIS_TIMEOUT = float(os.getenv("SYNTHESIS_TIMEOUT", 60))
+LOG_TIMEOUT = float(os.getenv("LOG_TIMEOUT", 10))
 
 MASTER_PROMPT = """
 You are a senior financial analyst.
@@ -23,52 +32,332 @@ Use the extracted metrics + management commentary to produce:
 Return ONLY valid JSON.
 """
 
+SYNTHESIS_ERROR = {"forecast_summary": "Error generating forecast"}
+# metadata.qualitative and the themes event have this shape on every path; only
+# precomputed artifacts fill by_quarter.
+QUALITATIVE_ERROR = {"themes": [], "sentiment": "unknown", "forward_looking": [], "by_quarter": []}
+_DONE = object()
+
+
+async def _iterate_in_thread(stage, fn, *args):
+    # Runs a blocking generator on the stage's thread pool and re-yields its items on the loop.
+    # If the consumer goes away (cancelled, closed, timed out), the worker closes the
+    # generator at its next item, which ends e.g. an OpenAI stream or pending pool jobs.
+    loop = asyncio.get_running_loop()
+    items = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(item):
+        if not stop.is_set():
+            loop.call_soon_threadsafe(items.put_nowait, item)
+
+    def produce():
+        gen = None
+        try:
+            gen = fn(*args)
+            for item in gen:
+                if stop.is_set():
+                    break
+                put((item, None))
+        except Exception as e:
+            put((None, e))
+        finally:
+            # The consumer waits for _DONE, so it goes out even if closing fails.
+            try:
+                if hasattr(gen, "close"):
+                    gen.close()
+            finally:
+                put((_DONE, None))
+
+    worker = asyncio.ensure_future(run(stage, produce))
+    try:
+        while True:
+            item, error = await items.get()
+            if error is not None:
+                raise error
+            if item is _DONE:
+                break
+            yield item
+        await worker
+    finally:
+        stop.set()
+
+
 class ForecastingAgent:
     def __init__(self, rag=None):
         self.rag = rag if rag else QualitativeAnalysisTool()
 
-    def generate_forecast(self, query, docs, transcripts):
-        request_id = str(uuid.uuid4())
-
-        extracted = []
-        for d in docs:
-            metrics, meta = extract_metrics_from_pdf(d["path"], d.get("url"))
-            extracted.append({"source": d, "metrics": metrics, "meta": meta})
+    def _extract(self, docs):
+        return [
+            {"source": d, "metrics": metrics, "meta": meta}
+            for d, (metrics, meta) in zip(docs, extract_metrics_batch(docs))
+        ]
 
-        self.rag.ingest_transcripts(transcripts)
+    def _qualitative(self, query, transcripts, deadline=None):
+        # Each step checks the deadline first, so a timed-out request stops at the next one.
+        ingest = self.rag.ingest_transcripts(transcripts)
+        check_deadline(deadline, "qualitative")
         snippets = self.rag.query(query, 5)
-        qual = extract_themes_and_sentiment(snippets)
+        check_deadline(deadline, "qualitative")
+        qual = {**extract_themes_and_sentiment(snippets), "by_quarter": []}
+        return ingest, qual
 
+    def _prompt(self, query, extracted, qual):
         context = {
             "query": query,
             "metrics": extracted,
             "qualitative": qual
         }
 
-        prompt = MASTER_PROMPT + "\n\nContext:\n" + json.dumps(context, indent=2)
+        return MASTER_PROMPT + "\n\nContext:\n" + json.dumps(context, indent=2)
+
+    def _parse(self, text):
+        match = re.search(r"(\{.*\})", text, flags=re.S)
+        return json.loads(match.group(1)) if match else {"forecast_summary": text}
 
+    def _synthesize(self, query, extracted, qual, timeout=None):
         try:
-            resp = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.0,
-            )
-            text = resp.choices[0].message.content
-            match = re.search(r"(\{.*\})", text, flags=re.S)
-            final_json = json.loads(match.group(1)) if match else {"forecast_summary": text}
+            with span("synthesis"):
+                text = chat(self._prompt(query, extracted, qual), model="gpt-4o-mini", temperature=0.0, semantic=True, timeout=timeout)
+            return self._parse(text)
         except Exception as e:
             print("OpenAI synthesis error:", e)
-            final_json = {"forecast_summary": "Error generating forecast"}
+            return dict(SYNTHESIS_ERROR)
 
-        response = {
+    def _response(self, request_id, final_json, extracted, qual, ingest, metadata=None):
+        return {
             "request_id": request_id,
             **final_json,
-            "metadata": {"extracted": extracted, "qualitative": qual}
+            "metadata": {
+                "extracted": extracted,
+                "qualitative": qual,
+                "ingest": ingest,
+                **(metadata or {}),
+            }
         }
 
+    def generate_forecast(self, query, docs, transcripts):
+        request_id = str(uuid.uuid4())
+
+        extracted = self._extract(docs)
+        ingest, qual = self._qualitative(query, transcripts)
+        final_json = self._synthesize(query, extracted, qual)
+        response = self._response(request_id, final_json, extracted, qual, ingest)
+
         try:
-            log_request(request_id, query, json.dumps(response))
+            with span("db_log"):
+                log_request(request_id, query, json.dumps(response))
         except:
             pass
 
         return response
+
+    async def agenerate_forecast(self, query, docs, transcripts, metadata=None):
+        request_id = str(uuid.uuid4())
+
+        # Metric extraction and the RAG/theme branch don't depend on each other,
+        # so both run at once and each gets its own deadline.
+        extracted, (ingest, qual) = await asyncio.gather(
+            self._aextract(docs),
+            self._aqualitative(query, transcripts),
+        )
+
+        return await self._afinish(request_id, query, extracted, qual, ingest, metadata)
+
+    async def agenerate_from_artifacts(self, query, artifacts, metadata=None):
+        # Precomputed by app.jobs.refresh: the request only pays for one synthesis call.
+        request_id = str(uuid.uuid4())
+        extracted = artifacts["metrics"]
+        qual = artifacts["qualitative"]
+
+        metadata = {"artifacts": {"updated_at": artifacts.get("updated_at")}, **(metadata or {})}
+        return await self._afinish(request_id, query, extracted, qual, {}, metadata)
+
+    async def _afinish(self, request_id, query, extracted, qual, ingest, metadata):
+        try:
+            final_json = await asyncio.wait_for(
+                run("synthesis", self._synthesize, query, extracted, qual, SYNTHESIS_TIMEOUT), SYNTHESIS_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            print("OpenAI synthesis timeout")
+            record_error("synthesis")
+            final_json = dict(SYNTHESIS_ERROR)
+        except Exception as e:
+            print("OpenAI synthesis error:", e)
+            record_error("synthesis")
+            final_json = dict(SYNTHESIS_ERROR)
+
+        response = self._response(request_id, final_json, extracted, qual, ingest, metadata)
+        await self._alog(request_id, query, response)
+        return response
+
+    async def _alog(self, request_id, query, response):
+        def write():
+            with span("db_log"):
+                log_request(request_id, query, json.dumps(response))
+
+        try:
+            await asyncio.wait_for(run("db_log", write), LOG_TIMEOUT)
+        except Exception:
+            pass
+
+    async def _aextract(self, docs):
+        # On timeout the batch generator is closed, which cancels the PDF jobs still
+        # queued; documents that finished in time keep their metrics.
+        extracted = [None] * len(docs)
+
+        async def collect():
+            async for i, (metrics, meta) in _iterate_in_thread("extract", iter_metrics_batch, docs):
+                extracted[i] = {"source": docs[i], "metrics": metrics, "meta": meta}
+
+        try:
+            await asyncio.wait_for(collect(), EXTRACT_TIMEOUT)
+            return extracted
+        except asyncio.TimeoutError:
+            print("Metric extraction timeout")
+            error = "timeout"
+        except Exception as e:
+            print("Metric extraction error:", e)
+            error = str(e)
+        record_error("extraction")
+        return [
+            e or {"source": d, "metrics": {}, "meta": {"method": "none", "error": error}}
+            for d, e in zip(docs, extracted)
+        ]
+
+    async def _aqualitative(self, query, transcripts):
+        try:
+            return await asyncio.wait_for(
+                run("qualitative", self._qualitative, query, transcripts, deadline_after(QUALITATIVE_TIMEOUT)),
+                QUALITATIVE_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            print("Qualitative analysis timeout")
+        except Exception as e:
+            print("Qualitative analysis error:", e)
+        record_error("qualitative")
+        return {}, dict(QUALITATIVE_ERROR)
+
+    # Streaming variants yield (event, data) pairs as each stage finishes: documents,
+    # downloads, per-document metrics, RAG snippets, themes, synthesis deltas and the
+    # final forecast. `documents` is an async source of ("documents", {...}) and
+    # ("download", doc) events, so discovery and downloads stream out as they happen
+    # while the RAG/theme branch is already running.
+    async def astream_forecast(self, query, documents, transcripts, metadata=None):
+        request_id = str(uuid.uuid4())
+        events = asyncio.Queue()
+        extracted = []
+        state = {"ingest": {}, "qual": dict(QUALITATIVE_ERROR)}
+
+        async def metrics_branch():
+            listed, docs = [], []
+            try:
+                async for event, data in documents:
+                    if event == "documents":
+                        listed = [d["url"] for d in data["documents"]]
+                        data = {"request_id": request_id, **data}
+                    elif data.get("path"):
+                        docs.append(data)
+                    await events.put((event, data))
+            finally:
+                await documents.aclose()
+
+            # Downloads finish in any order; extraction keeps the discovery order.
+            docs.sort(key=lambda d: listed.index(d["url"]) if d["url"] in listed else len(listed))
+            extracted.extend({"source": d, "metrics": {}, "meta": {"method": "none", "error": "timeout"}} for d in docs)
+
+            async def extract():
+                async for i, (metrics, meta) in _iterate_in_thread("extract", iter_metrics_batch, docs):
+                    extracted[i] = {"source": docs[i], "metrics": metrics, "meta": meta}
+                    await events.put(("metrics", extracted[i]))
+
+            await asyncio.wait_for(extract(), EXTRACT_TIMEOUT)
+
+        async def qualitative_branch():
+            state["ingest"] = await run("qualitative", self.rag.ingest_transcripts, transcripts)
+            snippets = await run("qualitative", self.rag.query, query, 5)
+            await events.put(("snippets", {"snippets": snippets}))
+            state["qual"] = {**await run("qualitative", extract_themes_and_sentiment, snippets), "by_quarter": []}
+            await events.put(("themes", state["qual"]))
+
+        async def guarded(branch, timeout, label, stage):
+            try:
+                await asyncio.wait_for(branch(), timeout)
+            except asyncio.TimeoutError:
+                print(label, "timeout")
+                record_error(stage)
+            except Exception as e:
+                print(label, "error:", e)
+                record_error(stage)
+            finally:
+                await events.put(_DONE)
+
+        tasks = [
+            # Discovery and downloads carry their own deadlines; extraction is bounded inside.
+            asyncio.create_task(guarded(metrics_branch, None, "Metric extraction", "extraction")),
+            asyncio.create_task(guarded(qualitative_branch, QUALITATIVE_TIMEOUT, "Qualitative analysis", "qualitative")),
+        ]
+        try:
+            pending = len(tasks)
+            while pending:
+                event = await events.get()
+                if event is _DONE:
+                    pending -= 1
+                    continue
+                yield event
+
+            async for event in self._astream_synthesis(request_id, query, extracted, state["qual"], state["ingest"], metadata):
+                yield event
+        finally:
+            # Reached early when the client disconnects: stop the branches still running.
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def astream_from_artifacts(self, query, artifacts, metadata=None):
+        request_id = str(uuid.uuid4())
+        extracted = artifacts["metrics"]
+        qual = artifacts["qualitative"]
+        documents = [{"title": e["source"]["title"], "url": e["source"]["url"]} for e in extracted]
+        yield "documents", {"request_id": request_id, "documents": documents}
+        for e in extracted:
+            yield "metrics", e
+        yield "themes", qual
+
+        metadata = {"artifacts": {"updated_at": artifacts.get("updated_at")}, **(metadata or {})}
+        async for event in self._astream_synthesis(request_id, query, extracted, qual, {}, metadata):
+            yield event
+
+    async def _astream_synthesis(self, request_id, query, extracted, qual, ingest, metadata):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        deadline = loop.time() + SYNTHESIS_TIMEOUT
+        prompt = self._prompt(query, extracted, qual)
+        deltas = _iterate_in_thread(
+            "synthesis", lambda: stream_chat(prompt, "gpt-4o-mini", 0.0, semantic=True, timeout=SYNTHESIS_TIMEOUT)
+        )
+        parts = []
+        try:
+            while True:
+                try:
+                    delta = await asyncio.wait_for(deltas.__anext__(), max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    break
+                parts.append(delta)
+                yield "synthesis", {"delta": delta}
+            final_json = self._parse("".join(parts))
+        except asyncio.TimeoutError:
+            print("OpenAI synthesis timeout")
+            record_error("synthesis")
+            final_json = dict(SYNTHESIS_ERROR)
+        except Exception as e:
+            print("OpenAI synthesis error:", e)
+            record_error("synthesis")
+            final_json = dict(SYNTHESIS_ERROR)
+        finally:
+            await deltas.aclose()
+        record("synthesis", time.perf_counter() - start)
+
+        response = self._response(request_id, final_json, extracted, qual, ingest, metadata)
+        await self._alog(request_id, query, response)
+        yield "forecast", response
@@ -1,6 +1,16 @@
-import mysql.connector
+from mysql.connector import pooling
+from mysql.connector.errors import PoolError
+import sqlite3
+import threading
+import atexit
+import queue
+import json
+import time
 import os
 from dotenv import load_dotenv
+
+from ..utils.metrics import span
+
 load_dotenv()
 
 MYSQL_HOST = os.getenv("MYSQL_HOST", "127.0.0.1")
@@ -9,28 +19,278 @@ MYSQL_USER = os.getenv("MYSQL_USER", "root")
 MYSQL_PASS = os.getenv("MYSQL_PASS", "")
 MYSQL_DB = os.getenv("MYSQL_DB", "tcs_forecasts")
 
+# "mysql" or "sqlite"; sqlite keeps the same tables in a local file for benchmarking.
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join("data", "tcs_forecasts.sqlite3"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+# Seconds to wait for a free pooled connection before giving up.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_WRITE_BEHIND = os.getenv("DB_WRITE_BEHIND", "1") != "0"
+DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", 50))
+DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", 1.0))
+DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", 1000))
+DB_ENQUEUE_TIMEOUT = float(os.getenv("DB_ENQUEUE_TIMEOUT", 5))
+
+LOG_REQUEST_SQL = "INSERT INTO request_logs (request_id, input_query, response_json) VALUES (%s, %s, %s)"
+SAVE_DOCUMENT_SQL = "INSERT INTO raw_documents (source, url, filename, content) VALUES (%s, %s, %s, %s)"
+# REPLACE is understood by both MySQL and SQLite and keys on the unique artifact_key.
+SAVE_ARTIFACT_SQL = (
+    "REPLACE INTO forecast_artifacts (artifact_key, kind, quarter, content_hash, payload) "
+    "VALUES (%s, %s, %s, %s, %s)"
+)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS request_logs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  request_id VARCHAR(64) NOT NULL,
+  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+  input_query TEXT,
+  response_json TEXT
+);
+
+CREATE TABLE IF NOT EXISTS raw_documents (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  source VARCHAR(255),
+  url TEXT,
+  filename VARCHAR(255),
+  content TEXT,
+  fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS forecast_artifacts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  artifact_key VARCHAR(255) NOT NULL UNIQUE,
+  kind VARCHAR(32) NOT NULL,
+  quarter VARCHAR(64),
+  content_hash VARCHAR(64),
+  payload TEXT,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+
+class MySQLBackend:
+    placeholder = "%s"
+
+    def __init__(self):
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name="tcs_forecasts",
+            pool_size=DB_POOL_SIZE,
+            host=MYSQL_HOST,
+            port=MYSQL_PORT,
+            user=MYSQL_USER,
+            password=MYSQL_PASS,
+            database=MYSQL_DB,
+            autocommit=True
+        )
+
+    def connect(self):
+        # Closing a pooled connection hands it back to the pool. get_connection raises
+        # as soon as the pool is empty, so wait for one to come back instead.
+        deadline = time.monotonic() + DB_POOL_TIMEOUT
+        delay = 0.01
+        while True:
+            try:
+                return self.pool.get_connection()
+            except PoolError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+
+
+class SQLiteBackend:
+    placeholder = "?"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self.connect()
+        conn.executescript(SQLITE_SCHEMA)
+        conn.close()
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    # Per process: a forked child must not reuse the parent's pooled sockets, so it
+    # builds its own backend (the parent's is left alone, not closed).
+    global _backend, _backend_pid
+    if _backend is None or _backend_pid != os.getpid():
+        with _backend_lock:
+            if _backend is None or _backend_pid != os.getpid():
+                _backend = SQLiteBackend() if DB_BACKEND == "sqlite" else MySQLBackend()
+                _backend_pid = os.getpid()
+    return _backend
+
+
 def get_conn():
-    return mysql.connector.connect(
-        host=MYSQL_HOST,
-        port=MYSQL_PORT,
-        user=MYSQL_USER,
-        password=MYSQL_PASS,
-        database=MYSQL_DB,
-        autocommit=True
-    )
+    return get_backend().connect()
+
+
+def executemany(sql, rows):
+    backend = get_backend()
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(sql.replace("%s", backend.placeholder), rows)
+        cursor.close()
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def fetchall(sql, params=()):
+    backend = get_backend()
+    conn = backend.connect()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql.replace("%s", backend.placeholder), params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        conn.close()
+
+
+class WriteBehindQueue:
+    # Inserts are queued and written by a background thread in executemany batches,
+    # flushed every batch_size rows or flush_interval seconds, whichever comes first.
+    _STOP = object()
+
+    def __init__(self, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL, maxsize=DB_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+
+    def _ensure_started(self):
+        # Re-created after a fork: the child inherits the queue but not the thread.
+        if self.thread is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.thread is None or self.pid != os.getpid():
+                self.queue = queue.Queue(self.maxsize)
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+                self.thread.start()
+
+    def put(self, sql, row):
+        self._ensure_started()
+        try:
+            # A full queue blocks the caller (backpressure) before falling back to
+            # writing the row inline.
+            self.queue.put((sql, row), timeout=DB_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            executemany(sql, [row])
+
+    def flush(self, timeout=None):
+        if self.thread is None or self.pid != os.getpid():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def shutdown(self, timeout=None):
+        if self.thread is None or self.pid != os.getpid():
+            return
+        self.queue.put(self._STOP)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _write(self, pending):
+        for sql, rows in pending.items():
+            try:
+                with span("db_write"):
+                    executemany(sql, rows)
+            except Exception as e:
+                print("DB write error:", e)
+
+    def _run(self):
+        pending, count = {}, 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is self._STOP or isinstance(item, threading.Event):
+                self._write(pending)
+                pending, count = {}, 0
+                deadline = time.monotonic() + self.flush_interval
+                if item is self._STOP:
+                    return
+                item.set()
+                continue
+
+            if item is not None:
+                sql, row = item
+                pending.setdefault(sql, []).append(row)
+                count += 1
+            if count >= self.batch_size or time.monotonic() >= deadline:
+                self._write(pending)
+                pending, count = {}, 0
+                deadline = time.monotonic() + self.flush_interval
+
+
+_writer = WriteBehindQueue()
+
+
+def _insert(sql, row):
+    if DB_WRITE_BEHIND:
+        _writer.put(sql, row)
+    else:
+        executemany(sql, [row])
+
 
 def log_request(request_id: str, input_query: str, response_json: str):
-    conn = get_conn()
-    cursor = conn.cursor()
-    sql = "INSERT INTO request_logs (request_id, input_query, response_json) VALUES (%s, %s, %s)"
-    cursor.execute(sql, (request_id, input_query, response_json))
-    cursor.close()
-    conn.close()
+    _insert(LOG_REQUEST_SQL, (request_id, input_query, response_json))
 
 def save_document(source, url, filename, content):
-    conn = get_conn()
-    cursor = conn.cursor()
-    sql = "INSERT INTO raw_documents (source, url, filename, content) VALUES (%s, %s, %s, %s)"
-    cursor.execute(sql, (source, url, filename, content))
-    cursor.close()
-    conn.close()
+    _insert(SAVE_DOCUMENT_SQL, (source, url, filename, content))
+
+def save_artifact(key, kind, quarter, content_hash, payload):
+    # Artifacts are read back by the request path, so they skip the write-behind queue.
+    executemany(SAVE_ARTIFACT_SQL, [(key, kind, quarter, content_hash, json.dumps(payload))])
+
+def load_artifacts(kind=None):
+    sql = "SELECT artifact_key, kind, quarter, content_hash, payload, updated_at FROM forecast_artifacts"
+    params = ()
+    if kind:
+        sql += " WHERE kind = %s"
+        params = (kind,)
+    return [
+        {
+            "key": key,
+            "kind": kind,
+            "quarter": quarter,
+            "content_hash": content_hash,
+            "payload": json.loads(payload) if payload else None,
+            "updated_at": str(updated_at),
+        }
+        for key, kind, quarter, content_hash, payload, updated_at in fetchall(sql, params)
+    ]
+
+def delete_artifacts(keys):
+    if keys:
+        executemany("DELETE FROM forecast_artifacts WHERE artifact_key = %s", [(k,) for k in keys])
+
+def flush_logs(timeout=None):
+    _writer.flush(timeout)
+
+def shutdown_logger(timeout=None):
+    _writer.shutdown(timeout)
+
+
+atexit.register(shutdown_logger)
@@ -0,0 +1,127 @@
+# app/jobs/refresh.py
+# Precomputes per-document metrics and per-quarter qualitative analysis so /forecast
+# only has to read them back and run synthesis. Run with: python -m app.jobs.refresh
+import os
+import json
+import hashlib
+import argparse
+from collections import OrderedDict
+
+from ..tools.financial_data_extractor import extract_metrics_from_pdf, file_hash
+from ..tools.qualitative_rag_tool import SAMPLE_TRANSCRIPTS, chunk_text, extract_themes_and_sentiment, combine_quarters
+from ..database.mysql_logger import save_artifact, load_artifacts, delete_artifacts
+from ..utils.scraper import fetch_screener_docs, fetch_document
+from ..utils.quarters import quarter_label, quarter_index
+
+REFRESH_QUARTERS = int(os.getenv("REFRESH_QUARTERS", 8))
+DOCUMENT_INDEX_KEY = "index:documents"
+
+
+def _known(kind):
+    return {a["key"]: a for a in load_artifacts(kind)}
+
+
+def refresh_documents(quarters=REFRESH_QUARTERS):
+    docs = fetch_screener_docs()[:quarters]
+    known = _known("metrics")
+    summary = {"processed": 0, "unchanged": 0, "failed": 0}
+    order = []
+
+    for d in docs:
+        try:
+            fetched = fetch_document(d["url"])
+            digest = fetched.get("sha256") or file_hash(fetched["path"])
+        except Exception as e:
+            print("Refresh download error:", e)
+            summary["failed"] += 1
+            if d["url"] in known:
+                order.append(d["url"])
+            continue
+        order.append(d["url"])
+        prev = known.get(d["url"])
+        # Documents that yielded nothing last time are retried (e.g. an API key was added since).
+        if prev and prev["content_hash"] == digest and (prev["payload"] or {}).get("metrics"):
+            summary["unchanged"] += 1
+            continue
+
+        source = {"title": d["title"], "url": d["url"], "path": fetched["path"]}
+        metrics, meta = extract_metrics_from_pdf(fetched["path"], d["url"], stop_early=False)
+        save_artifact(d["url"], "metrics", quarter_label(d["title"]), digest,
+                      {"source": source, "metrics": metrics, "meta": meta})
+        summary["processed"] += 1
+
+    # The index keeps the screener ordering (latest first) for the request path.
+    save_artifact(DOCUMENT_INDEX_KEY, "index", None, None, order)
+    delete_artifacts([k for k in known if k not in order])
+    return summary
+
+
+def refresh_qualitative(transcripts=SAMPLE_TRANSCRIPTS):
+    by_quarter = OrderedDict()
+    for t in transcripts:
+        by_quarter.setdefault(quarter_label(t["title"]), []).append(t)
+
+    known = _known("qualitative")
+    summary = {"processed": 0, "unchanged": 0}
+    for quarter, group in by_quarter.items():
+        key = f"qualitative:{quarter}"
+        blob = json.dumps([[t["title"], t["text"]] for t in group]).encode("utf-8")
+        digest = hashlib.sha256(blob).hexdigest()
+        if key in known and known[key]["content_hash"] == digest:
+            summary["unchanged"] += 1
+            continue
+        snippets = [c for t in group for c in chunk_text(t["text"])]
+        qual = extract_themes_and_sentiment(snippets)
+        save_artifact(key, "qualitative", quarter, digest, qual)
+        summary["processed"] += 1
+
+    # Quarters whose transcripts are gone would otherwise be served forever.
+    stale = [k for k in known if k not in {f"qualitative:{q}" for q in by_quarter}]
+    delete_artifacts(stale)
+    summary["removed"] = len(stale)
+    return summary
+
+
+def refresh(quarters=REFRESH_QUARTERS, transcripts=SAMPLE_TRANSCRIPTS):
+    summary = {}
+    try:
+        summary["documents"] = refresh_documents(quarters)
+    except Exception as e:
+        print("Refresh documents error:", e)
+        summary["documents"] = {"error": str(e)}
+    try:
+        summary["qualitative"] = refresh_qualitative(transcripts)
+    except Exception as e:
+        print("Refresh qualitative error:", e)
+        summary["qualitative"] = {"error": str(e)}
+    return summary
+
+
+def load_forecast_artifacts(quarters):
+    artifacts = {a["key"]: a for a in load_artifacts()}
+    index = artifacts.get(DOCUMENT_INDEX_KEY)
+    order = index["payload"] if index else []
+    metrics = [artifacts[url] for url in order if url in artifacts][:quarters]
+    # Latest quarters first, capped like the documents.
+    qualitative = sorted(
+        (a for a in artifacts.values() if a["kind"] == "qualitative"),
+        key=lambda a: quarter_index(a["quarter"]),
+        reverse=True,
+    )[:quarters]
+    return {
+        "metrics": [a["payload"] for a in metrics],
+        # Same shape as the live pipeline's analysis, with per-quarter results under by_quarter.
+        "qualitative": combine_quarters([{**a["payload"], "quarter": a["quarter"]} for a in qualitative]),
+        "updated_at": max((a["updated_at"] for a in metrics + qualitative), default=None),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute forecast artifacts for new or changed documents.")
+    parser.add_argument("--quarters", type=int, default=REFRESH_QUARTERS)
+    args = parser.parse_args()
+    print(json.dumps(refresh(args.quarters), indent=2))
+
+
+if __name__ == "__main__":
+    main()
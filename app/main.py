@@ -1,39 +1,209 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from contextlib import asynccontextmanager
 from .schemas import ForecastRequest, ForecastResponse
 from .agents.forecasting_agent import ForecastingAgent
-from .tools.qualitative_rag_tool import QualitativeAnalysisTool
-from .utils.scraper import fetch_screener_docs, download_file
+from .tools.qualitative_rag_tool import QualitativeAnalysisTool, SAMPLE_TRANSCRIPTS
+from .tools.financial_data_extractor import shutdown_extraction_pool
+from .database.mysql_logger import shutdown_logger
+from .utils.scraper import async_discover_docs, async_fetch_document, aclose_async_client
+from .jobs.refresh import refresh, load_forecast_artifacts
+from .utils.embeddings import embedding_stats
+from .utils.llm import llm_stats
+from .utils.executors import shutdown_executors
+from .utils import metrics, resources
+import asyncio
+import json
 import os
 
-app = FastAPI(title="TCS Financial Forecasting Agent")
-
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", 30))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", 60))
+USE_ARTIFACTS = os.getenv("USE_ARTIFACTS", "1") != "0"
+REFRESH_ON_STARTUP = os.getenv("REFRESH_ON_STARTUP", "1") != "0"
+# Seconds between background refreshes; 0 runs the refresh once at startup only.
+REFRESH_INTERVAL = float(os.getenv("REFRESH_INTERVAL", 6 * 3600))
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") != "0"
+# Comma-separated subset of openai, vector_store, embedding_model; empty warms all of them.
+WARMUP_RESOURCES = [r.strip() for r in os.getenv("WARMUP_RESOURCES", "").split(",") if r.strip()]
+WARMUP_RETRIES = int(os.getenv("WARMUP_RETRIES", 2))
+WARMUP_RETRY_DELAY = float(os.getenv("WARMUP_RETRY_DELAY", 5))
 
 qual_tool = QualitativeAnalysisTool()
 agent = ForecastingAgent(qual_tool)
+_refresh_task = None
+_warmup_task = None
 
-@app.post("/forecast", response_model=ForecastResponse)
-def forecast(req: ForecastRequest):
-   
+metrics.register(metrics.Gauge("forecast_embedding_cache_hit_ratio", "Embedding cache hit ratio.", lambda: embedding_stats()["hit_rate"]))
+metrics.register(metrics.Gauge("forecast_llm_cache_hit_ratio", "LLM response cache hit ratio.", lambda: llm_stats()["hit_rate"]))
+metrics.register(metrics.Gauge("forecast_llm_tokens_saved", "LLM tokens saved by the response cache.", lambda: llm_stats()["tokens_saved"]))
+
+
+async def _refresh_loop():
+    while True:
+        try:
+            summary = await asyncio.to_thread(refresh)
+            print("Artifact refresh:", summary)
+        except Exception as e:
+            print("Artifact refresh error:", e)
+        if REFRESH_INTERVAL <= 0:
+            return
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+def _warm_up():
+    state = resources.warm_up(WARMUP_RESOURCES or None, WARMUP_RETRIES, WARMUP_RETRY_DELAY)
+    if resources.loaded("vector_store"):
+        qual_tool.collection
+    print("Warm-up:", state)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _refresh_task, _warmup_task
+    if WARMUP_ON_STARTUP:
+        # Off the event loop so the server starts answering (and /ready reports 503) meanwhile.
+        _warmup_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+    else:
+        resources.warmup_state["status"] = "lazy"
+    if REFRESH_ON_STARTUP:
+        _refresh_task = asyncio.create_task(_refresh_loop())
+    yield
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+    await aclose_async_client()
+    shutdown_extraction_pool()
+    shutdown_executors()
+    shutdown_logger()
+
+
+app = FastAPI(title="TCS Financial Forecasting Agent", lifespan=lifespan)
+
+
+async def _download(d):
+    try:
+        with metrics.span("download"):
+            fetched = await asyncio.wait_for(async_fetch_document(d["url"], timeout=DOWNLOAD_TIMEOUT), DOWNLOAD_TIMEOUT)
+    except Exception as e:
+        return None
+    return {"title": d["title"], "path": fetched["path"], "url": d["url"], "cache": fetched["cache"]}
+
+
+async def _load_artifacts(req):
+    if not USE_ARTIFACTS:
+        return None
+    try:
+        with metrics.span("artifact_load"):
+            artifacts = await asyncio.to_thread(load_forecast_artifacts, req.quarters)
+    except Exception as e:
+        print("Artifact load error:", e)
+        return None
+    # Qualitative artifacts alone (e.g. the document refresh failed) would answer every
+    # request without metrics, so those requests take the live pipeline instead.
+    if artifacts["metrics"]:
+        return artifacts
+    return None
+
+
+async def _stream_documents(req, cache):
+    # Yields ("documents", {...}) right after discovery, then ("download", doc) as each
+    # download finishes; failed downloads carry an "error" instead of a "path".
     try:
-        docs_meta = fetch_screener_docs()
+        with metrics.span("screener_fetch"):
+            docs_meta, discovery = await asyncio.wait_for(async_discover_docs(), FETCH_TIMEOUT)
     except Exception as e:
-        docs_meta = []
-    
+        docs_meta, discovery = [], "error"
     docs_to_download = docs_meta[:req.quarters]
-    downloaded = []
-    for d in docs_to_download:
-        try:
-            path = download_file(d["url"])
-            downloaded.append({"title": d["title"], "path": path, "url": d["url"]})
-        except Exception as e:
-            
-            continue
+    cache["discovery"] = discovery
+    cache["downloads"] = {"hit": 0, "miss": 0}
+    yield "documents", {"documents": docs_to_download}
+
+    async def one(d):
+        return d, await _download(d)
+
+    tasks = [asyncio.ensure_future(one(d)) for d in docs_to_download]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            d, fetched = await next_done
+            if fetched is None:
+                yield "download", {"title": d["title"], "url": d["url"], "error": "download failed"}
+                continue
+            if fetched["cache"] in cache["downloads"]:
+                cache["downloads"][fetched["cache"]] += 1
+            yield "download", fetched
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
-    transcripts = [
-        {"title": "Earnings Call Q1", "text": "Management is focused on growth in digital services and operating margin discipline. We are cautious about wage inflation and macro."},
-        {"title": "Earnings Call Q2", "text": "Strong deal wins in Europe. Management sees demand for cloud transformation. Potential margin pressure due to INR depreciation."},
-        {"title": "Earnings Call Q3", "text": "Hiring ramp and investments will continue. Management expects moderate revenue growth next quarter."}
-    ]
+async def _collect_documents(req):
+    cache = {}
+    listed, downloaded = [], {}
+    async for event, data in _stream_documents(req, cache):
+        if event == "documents":
+            listed = data["documents"]
+        elif data.get("path"):
+            downloaded[data["url"]] = data
+    return [downloaded[d["url"]] for d in listed if d["url"] in downloaded], cache
 
-    response_dict = agent.generate_forecast(req.query, downloaded, transcripts)
+
+async def _forecast(req, timings):
+    artifacts = await _load_artifacts(req)
+    if artifacts:
+        return await agent.agenerate_from_artifacts(req.query, artifacts, metadata={"timings": timings})
+
+    downloaded, cache = await _collect_documents(req)
+    metadata = {"cache": cache, "timings": timings}
+    return await agent.agenerate_forecast(req.query, downloaded, SAMPLE_TRANSCRIPTS, metadata=metadata)
+
+
+@app.post("/forecast", response_model=ForecastResponse)
+async def forecast(req: ForecastRequest, request: Request):
+    timings = metrics.start_request()
+    with metrics.profile(metrics.profiling_requested(request.headers)) as prof:
+        response_dict = await _forecast(req, timings)
+    if prof is not None:
+        response_dict["metadata"]["profile"] = prof
     return response_dict
+
+
+@app.get("/ready")
+def ready():
+    state = resources.status()
+    return JSONResponse(state, status_code=200 if state["status"] in ("ready", "lazy") else 503)
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _format_event(event, data, fmt):
+    payload = json.dumps(data, default=str)
+    if fmt == "ndjson":
+        return f'{{"event": "{event}", "data": {payload}}}\n'
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+async def _forecast_events(req, fmt):
+    timings = metrics.start_request()
+    artifacts = await _load_artifacts(req)
+    if artifacts:
+        events = agent.astream_from_artifacts(req.query, artifacts, metadata={"timings": timings})
+    else:
+        cache = {}
+        metadata = {"cache": cache, "timings": timings}
+        events = agent.astream_forecast(req.query, _stream_documents(req, cache), SAMPLE_TRANSCRIPTS, metadata=metadata)
+    async for event, data in events:
+        yield _format_event(event, data, fmt)
+
+
+@app.post("/forecast/stream")
+async def forecast_stream(req: ForecastRequest, format: str = "sse"):
+    if format not in ("sse", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be 'sse' or 'ndjson'")
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+    return StreamingResponse(
+        _forecast_events(req, format),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,41 +1,204 @@
 import os
 import re
 import json
+import hashlib
+import threading
+import time
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 import pdfplumber
 from dotenv import load_dotenv
-from ..database.mysql_logger import save_document
-
-from openai import OpenAI
+from ..database.mysql_logger import save_document, shutdown_logger
+from ..utils.llm import chat
+from ..utils.metrics import record, record_error, cache_events, extraction_methods
 
 load_dotenv()
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_KEY)
 
+# Bump when extraction logic changes in a way that should invalidate cached results.
+EXTRACTOR_VERSION = "1"
+CACHE_DIR = os.getenv("EXTRACT_CACHE_DIR", os.path.join("data", ".extract_cache"))
+CACHE_MAX_BYTES = int(os.getenv("EXTRACT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_ENABLED = os.getenv("EXTRACT_CACHE", "1") != "0"
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+PDF_STOP_EARLY = os.getenv("PDF_STOP_EARLY", "1") != "0"
+# Workers start fresh rather than forking the server, which is running DB writer,
+# embedding batcher and event-loop threads. "forkserver" is also fine on POSIX.
+PDF_POOL_CONTEXT = os.getenv("PDF_POOL_CONTEXT", "spawn")
 
-def extract_text_from_pdf(path):
-    text_pages = []
+# While streaming, a match is only accepted once it sits this far from the end of the
+# text seen so far, so a hit can never differ from searching the fully joined text.
+_STREAM_MARGIN = 128
+
+METRIC_PATTERNS = {
+    "total_revenue": r"(?:total\s+revenue|revenue)[^\d]{0,40}([\d,\.]+\s*(?:crore|cr|₹|rs|INR)?)",
+    "net_profit": r"(?:net\s+profit|pat)[^\d]{0,40}([\d,\.]+\s*(?:crore|cr|₹|rs|INR)?)",
+    "operating_margin": r"(?:operating\s+margin)[^\d]{0,40}([\d\.]+%)"
+}
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def patterns_hash():
+    blob = json.dumps(METRIC_PATTERNS, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()[:12]
+
+
+def _cache_path(kind, key):
+    return os.path.join(CACHE_DIR, f"{key}.{kind}.json")
+
+
+def _cache_key(digest, kind):
+    # Page text only depends on the file; metrics also depend on the regex patterns,
+    # so editing METRIC_PATTERNS naturally misses every previously stored result.
+    if kind == "metrics":
+        return f"{digest}-v{EXTRACTOR_VERSION}-{patterns_hash()}"
+    return f"{digest}-v{EXTRACTOR_VERSION}"
+
+
+def cache_get(kind, digest):
+    if not CACHE_ENABLED:
+        return None
+    path = _cache_path(kind, _cache_key(digest, kind))
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)
+        os.utime(path)  # mtime doubles as the LRU timestamp
+    except (OSError, ValueError):
+        return None
+    return value
+
+
+def cache_put(kind, digest, value):
+    if not CACHE_ENABLED:
+        return
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache_path(kind, _cache_key(digest, kind))
+    tmp = path + ".tmp"
     try:
-        with pdfplumber.open(path) as pdf:
-            for p in pdf.pages:
-                text_pages.append(p.extract_text() or "")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print("Extraction cache write error:", e)
+        return
+    _evict()
+
+
+def _evict():
+    entries = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+# kind is "text", "metrics" or None for both. stale_only keeps entries that match the
+# current EXTRACTOR_VERSION / METRIC_PATTERNS and drops everything else.
+def invalidate_extraction_cache(kind=None, stale_only=False):
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+    current = (f"-v{EXTRACTOR_VERSION}.text.json", f"-v{EXTRACTOR_VERSION}-{patterns_hash()}.metrics.json")
+    removed = 0
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        if kind and not name.endswith(f".{kind}.json"):
+            continue
+        if stale_only and name.endswith(current):
+            continue
+        try:
+            os.remove(os.path.join(CACHE_DIR, name))
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def iter_pdf_pages(path):
+    with pdfplumber.open(path) as pdf:
+        for p in pdf.pages:
+            text = p.extract_text() or ""
+            p.flush_cache()
+            yield text
+
+
+def extract_pages_from_pdf(path):
+    try:
+        return list(iter_pdf_pages(path))
     except Exception as e:
         print("PDF error:", e)
+        return None
+
+
+def extract_text_from_pdf(path):
+    pages = extract_pages_from_pdf(path)
+    if pages is None:
         return ""
-    return "\n".join(text_pages)
+    return "\n".join(pages)
 
 
-def simple_regex_extract(text):
+def simple_regex_extract(text, stop_early=False):
+    # text may be a string or an iterable of page strings; pages are matched as if
+    # joined with "\n", and with stop_early the iterable is not consumed any further
+    # once every metric has been found.
+    pages = iter([text] if isinstance(text, str) else text)
+    pending = {k: re.compile(pat, flags=re.I) for k, pat in METRIC_PATTERNS.items()}
+    starts = dict.fromkeys(pending, 0)
     results = {}
-    patterns = {
-        "total_revenue": r"(?:total\s+revenue|revenue)[^\d]{0,40}([\d,\.]+\s*(?:crore|cr|₹|rs|INR)?)",
-        "net_profit": r"(?:net\s+profit|pat)[^\d]{0,40}([\d,\.]+\s*(?:crore|cr|₹|rs|INR)?)",
-        "operating_margin": r"(?:operating\s+margin)[^\d]{0,40}([\d\.]+%)"
-    }
-    for k, pat in patterns.items():
-        m = re.search(pat, text, flags=re.I)
+    window, base, first = "", 0, True
+
+    for page in pages:
+        window = page if first else window + "\n" + page
+        first = False
+        end = base + len(window)
+        for k, pat in list(pending.items()):
+            m = pat.search(window, starts[k] - base)
+            if m and m.start() + base < end - _STREAM_MARGIN and m.end() + base + 8 < end:
+                results[k] = m.group(1).strip()
+                del pending[k]
+                continue
+            floor = end - _STREAM_MARGIN
+            starts[k] = max(starts[k], min(m.start() + base, floor) if m else floor)
+        if not pending:
+            if stop_early:
+                return results
+            # Without stop_early the caller wants every page parsed (full text, cache).
+            for _ in pages:
+                pass
+            break
+        cut = min(starts[k] for k in pending) - base
+        if cut > 0:
+            window, base = window[cut:], base + cut
+
+    for k, pat in pending.items():
+        m = pat.search(window, max(starts[k] - base, 0))
         if m:
             results[k] = m.group(1).strip()
-    return results
+    return {k: results[k] for k in METRIC_PATTERNS if k in results}
 
 
 def llm_extract_summary(text):
@@ -49,13 +212,7 @@ def llm_extract_summary(text):
     )
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.0,
-            max_tokens=600,
-        )
-        content = response.choices[0].message.content
+        content = chat(prompt, model="gpt-4o-mini", temperature=0.0, max_tokens=600)
         match = re.search(r"(\{.*\})", content, flags=re.S)
         if match:
             return json.loads(match.group(1))
@@ -65,21 +222,197 @@ def llm_extract_summary(text):
     return {}
 
 
-def extract_metrics_from_pdf(path, source_url=None):
-    text = extract_text_from_pdf(path)
+def _stream_pages(path, sink, state):
+    state["parse_seconds"] = 0.0
+    try:
+        pages = iter_pdf_pages(path)
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            state["parse_seconds"] += time.perf_counter() - start
+            if page is None:
+                break
+            sink.append(page)
+            yield page
+    except Exception as e:
+        print("PDF error:", e)
+        sink.clear()
+        state["error"] = True
+    state["done"] = True
+
+
+def extract_metrics_from_pdf(path, source_url=None, stop_early=None):
+    stop_early = PDF_STOP_EARLY if stop_early is None else stop_early
+    try:
+        digest = file_hash(path)
+    except OSError as e:
+        print("PDF error:", e)
+        digest = None
+
+    if digest:
+        cached = cache_get("metrics", digest)
+        if cached:
+            return cached["metrics"], {**cached["meta"], "cache": "hit"}
 
-    if source_url:
+    timings = {}
+    pages = cache_get("text", digest) if digest else None
+    start = time.perf_counter()
+    if pages is not None:
+        heur = simple_regex_extract(pages)
+        complete = True
+        timings["regex_extract"] = time.perf_counter() - start
+    else:
+        pages, state = [], {}
+        stream = _stream_pages(path, pages, state)
+        heur = simple_regex_extract(stream, stop_early=stop_early)
+        stream.close()
+        # Parsing and matching interleave while streaming, so split the wall time.
+        timings["pdf_parse"] = state["parse_seconds"]
+        timings["regex_extract"] = time.perf_counter() - start - state["parse_seconds"]
+        complete = state.get("done", False)
+        if state.get("error"):
+            heur = {}
+        elif complete and pages and digest:
+            cache_put("text", digest, pages)
+    text = "\n".join(pages)
+
+    # An early stop only parsed a prefix of the document; raw_documents holds full
+    # source text, so the row is left to a complete parse (e.g. the refresh job).
+    if source_url and complete:
         try:
             save_document("pdf", source_url, os.path.basename(path), text)
         except Exception as e:
             print("Save document error:", e)
 
-    heur = simple_regex_extract(text)
+    metrics, meta = {}, {"method": "none"}
     if len(heur) >= 2:
-        return heur, {"method": "regex"}
+        metrics, meta = heur, {"method": "regex"}
+    else:
+        start = time.perf_counter()
+        llm_res = llm_extract_summary(text)
+        timings["llm_extract"] = time.perf_counter() - start
+        if llm_res:
+            metrics, meta = llm_res, {"method": "llm"}
+
+    # "none" is not cached so a later run with an API key still gets a chance.
+    if digest and metrics:
+        cache_put("metrics", digest, {"metrics": metrics, "meta": meta})
+    # Timings travel back in meta because pool workers can't record into this process.
+    meta = {**meta, "cache": "miss", "timings": timings}
+    if not complete:
+        meta["pages_parsed"] = len(pages)
+    return metrics, meta
+
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(PDF_POOL_CONTEXT),
+                initializer=_init_worker,
+            )
+            _pool_workers = workers
+        return _pool
+
+
+def _discard_pool(pool):
+    # A worker that dies (OOM kill, segfault in a parser) breaks the whole executor,
+    # so it is dropped and the next _get_pool builds a new one.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
 
-    llm_res = llm_extract_summary(text)
-    if llm_res:
-        return llm_res, {"method": "llm"}
 
-    return {}, {"method": "none"}
+def shutdown_extraction_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
+
+
+def _init_worker():
+    # Pool workers exit through multiprocessing, which skips atexit; drain the
+    # write-behind queue from its exit hook instead of after every job.
+    multiprocessing.util.Finalize(None, shutdown_logger, exitpriority=10)
+
+
+def _extract_job(job):
+    path, url = job
+    return extract_metrics_from_pdf(path, url)
+
+
+def _record_extraction(meta):
+    for stage, seconds in (meta.get("timings") or {}).items():
+        record(stage, seconds)
+    extraction_methods.inc(method=meta.get("method", "none"))
+    cache_events.inc(cache="extraction", result=meta.get("cache", "miss"))
+
+
+def iter_metrics_batch(docs, workers=None):
+    # Yields (index, (metrics, meta)) as each document finishes, not in input order.
+    workers = PDF_WORKERS if workers is None else workers
+    jobs = [(d["path"], d.get("url")) for d in docs]
+    if workers <= 1 or len(jobs) <= 1:
+        for i, job in enumerate(jobs):
+            result = _extract_job(job)
+            _record_extraction(result[1])
+            yield i, result
+        return
+    pool = _get_pool(workers)
+    try:
+        futures = {pool.submit(_extract_job, job): i for i, job in enumerate(jobs)}
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        pool = _get_pool(workers)
+        futures = {pool.submit(_extract_job, job): i for i, job in enumerate(jobs)}
+
+    broken = []
+    try:
+        for fut in as_completed(futures):
+            try:
+                result = fut.result()
+            except BrokenProcessPool:
+                broken.append(futures[fut])
+                continue
+            _record_extraction(result[1])
+            yield futures[fut], result
+    finally:
+        # Closed early (the caller timed out or went away): drop the jobs still queued
+        # so they don't hold pool slots other requests are waiting for.
+        for fut in futures:
+            fut.cancel()
+
+    if broken:
+        _discard_pool(pool)
+    # Jobs lost with a crashed worker are retried one at a time on a fresh pool, so a
+    # PDF that keeps killing workers only fails itself.
+    for i in sorted(broken):
+        pool = _get_pool(workers)
+        try:
+            result = pool.submit(_extract_job, jobs[i]).result()
+        except BrokenProcessPool:
+            print("PDF worker crashed:", jobs[i][0])
+            record_error("extract")
+            _discard_pool(pool)
+            result = ({}, {"method": "none", "cache": "miss", "error": "worker crashed"})
+        _record_extraction(result[1])
+        yield i, result
+
+
+def extract_metrics_batch(docs, workers=None):
+    results = [None] * len(docs)
+    for i, result in iter_metrics_batch(docs, workers):
+        results[i] = result
+    return results
@@ -1,37 +1,250 @@
 import os
 import json
 import re
+import hashlib
 from typing import List, Dict
 from dotenv import load_dotenv
-from openai import OpenAI
-import chromadb
 
 from ..utils.embeddings import embed_texts
+from ..utils.llm import chat
+from ..utils.metrics import span
+from ..utils.quarters import quarter_label, quarter_index
+from ..utils.vector_store import NumpyStore
+from ..utils import resources
 
 load_dotenv()
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_KEY)
 
-chroma = chromadb.Client()
+# chroma (persistent under CHROMA_PATH, in-memory if empty) or numpy for exact search
+# over small corpora, stored under VECTOR_PATH.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+CHROMA_PATH = os.getenv("CHROMA_PATH", "data/chroma")
+VECTOR_PATH = os.getenv("VECTOR_PATH", "data/vectors")
+DEFAULT_COMPANY = os.getenv("DEFAULT_COMPANY", "TCS")
+# Comma-separated names; when set (or when a transcript passes "speakers"), only these
+# labels start a turn. Otherwise a label must look like a name: 1-4 capitalised words
+# or initials, none of them a common heading word.
+SPEAKERS = [s.strip() for s in os.getenv("RAG_SPEAKERS", "").split(",") if s.strip()]
+SPEAKER_LINE = re.compile(r"^\s*([^:]{1,60}?)\s*:\s+(.*\S)\s*$")
+SPEAKER_NAME = re.compile(r"(?:[A-Z][A-Za-z'\-]*\.?\s*){1,4}")
+NOT_SPEAKER_WORDS = {
+    "agenda", "ceo", "cfo", "disclaimer", "growth", "guidance", "highlights", "key", "margin",
+    "net", "note", "outlook", "profit", "q", "question", "revenue", "risks", "safe", "summary",
+    "total", "update",
+}
+
+CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", 800))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", 100))
+INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", 64))
+
+SAMPLE_TRANSCRIPTS = [
+    {"title": "Earnings Call Q1", "text": "Management is focused on growth in digital services and operating margin discipline. We are cautious about wage inflation and macro."},
+    {"title": "Earnings Call Q2", "text": "Strong deal wins in Europe. Management sees demand for cloud transformation. Potential margin pressure due to INR depreciation."},
+    {"title": "Earnings Call Q3", "text": "Hiring ramp and investments will continue. Management expects moderate revenue growth next quarter."}
+]
+
+
+def chunk_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    words = text.split()
+    if not words:
+        return []
+    chunks, current, length = [], [], 0
+    i = 0
+    while i < len(words):
+        current.append(words[i])
+        length += len(words[i]) + 1
+        i += 1
+        if length >= size:
+            chunks.append(" ".join(current))
+            # carry the last few words over so sentences split at a boundary stay searchable
+            tail, tail_len = [], 0
+            for w in reversed(current):
+                if tail_len + len(w) + 1 > overlap:
+                    break
+                tail.insert(0, w)
+                tail_len += len(w) + 1
+            current, length = tail, tail_len
+            if i == len(words):
+                current = []
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def chunk_id(text, *scope):
+    blob = "\0".join(scope + (text,))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+
+def speaker_label(label, roster=None):
+    roster = roster if roster is not None else SPEAKERS
+    if roster:
+        return next((name for name in roster if name.lower() == label.lower()), None)
+    if not SPEAKER_NAME.fullmatch(label):
+        return None
+    words = re.findall(r"[a-z]+", label.lower())
+    return None if any(w in NOT_SPEAKER_WORDS for w in words) else label
+
+
+def speaker_turns(text, roster=None):
+    # "Name: remarks" lines start a new turn; text before the first one has no speaker.
+    turns = []
+    for line in text.splitlines():
+        m = SPEAKER_LINE.match(line)
+        speaker = speaker_label(m.group(1).strip(), roster) if m else None
+        if speaker and (not turns or turns[-1][0] != speaker):
+            turns.append([speaker, m.group(2)])
+        elif speaker:
+            turns[-1][1] += " " + m.group(2)
+        elif turns:
+            turns[-1][1] += " " + line
+        else:
+            turns.append(["", line])
+    return [(speaker, body) for speaker, body in turns if body.strip()]
+
+
+def build_where(quarter_from=None, quarter_to=None, speaker=None):
+    clauses = []
+    if quarter_from is not None:
+        clauses.append({"quarter_index": {"$gte": quarter_index(quarter_from)}})
+    if quarter_to is not None:
+        clauses.append({"quarter_index": {"$lte": quarter_index(quarter_to)}})
+    if speaker:
+        clauses.append({"speaker": {"$in": [speaker] if isinstance(speaker, str) else list(speaker)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _create_store():
+    if VECTOR_BACKEND == "numpy":
+        return NumpyStore(VECTOR_PATH)
+    import chromadb
+
+    return chromadb.PersistentClient(path=CHROMA_PATH) if CHROMA_PATH else chromadb.Client()
+
+
+resources.register("vector_store", _create_store)
 
 
 class QualitativeAnalysisTool:
-    def __init__(self, name="tcs_transcripts"):
-        try:
-            self.collection = chroma.get_collection(name)
-        except:
-            self.collection = chroma.create_collection(name)
-
-    def ingest_transcripts(self, docs: List[Dict]):
-        texts = [d["text"] for d in docs]
-        ids = [d["title"] for d in docs]
-        embeddings = embed_texts(texts).tolist()
-        self.collection.add(ids=ids, documents=texts, embeddings=embeddings)
-
-    def query(self, q: str, k=4):
+    # One collection per ticker ("<ticker>_<name>"); chunks carry company, title,
+    # quarter, quarter_index and speaker metadata for filtered retrieval.
+    def __init__(self, name="transcripts", company=DEFAULT_COMPANY):
+        self.name = name
+        self.company = company.upper()
+        self._collections = {}
+
+    def collection_for(self, company):
+        company = company.upper()
+        if company not in self._collections:
+            slug = re.sub(r"[^a-z0-9]+", "-", company.lower()).strip("-") or "default"
+            self._collections[company] = resources.get("vector_store").get_or_create_collection(f"{slug}_{self.name}")
+        return self._collections[company]
+
+    @property
+    def collection(self):
+        return self.collection_for(self.company)
+
+    def ingest_transcripts(self, docs: List[Dict]) -> Dict:
+        with span("rag_ingest"):
+            return self._ingest(docs)
+
+    def _ingest(self, docs):
+        by_company = {}
+        for d in docs:
+            company = (d.get("company") or self.company).upper()
+            quarter = d.get("quarter") or quarter_label(d["title"])
+            chunks, titles = by_company.setdefault(company, ({}, {}))
+            ids = titles.setdefault(d["title"], set())
+            if d.get("speaker"):
+                turns = [(d["speaker"], d["text"])]
+            else:
+                turns = speaker_turns(d["text"], d.get("speakers"))
+            i = 0
+            for speaker, body in turns:
+                for text in chunk_text(body):
+                    cid = chunk_id(text, d["title"], speaker)
+                    ids.add(cid)
+                    chunks.setdefault(cid, (text, {
+                        "company": company,
+                        "title": d["title"],
+                        "quarter": quarter,
+                        "quarter_index": quarter_index(quarter),
+                        "speaker": speaker,
+                        "chunk": i,
+                    }))
+                    i += 1
+
+        summary = {"new": 0, "skipped": 0, "removed": 0}
+        for company, (chunks, titles) in by_company.items():
+            for k, v in self._ingest_company(self.collection_for(company), chunks, titles).items():
+                summary[k] += v
+        return summary
+
+    def _ingest_company(self, collection, chunks, titles):
+        existing = set(collection.get(ids=list(chunks), include=[])["ids"]) if chunks else set()
+
+        # Chunks a changed document no longer produces are dropped so stale text
+        # stops showing up in retrieval.
+        stale = []
+        for title, ids in titles.items():
+            stored = collection.get(where={"title": title}, include=[])["ids"]
+            stale.extend(i for i in stored if i not in chunks)
+        if stale:
+            collection.delete(ids=stale)
+
+        new_ids = [cid for cid in chunks if cid not in existing]
+        for start in range(0, len(new_ids), INGEST_BATCH_SIZE):
+            batch = new_ids[start:start + INGEST_BATCH_SIZE]
+            texts = [chunks[cid][0] for cid in batch]
+            collection.upsert(
+                ids=batch,
+                documents=texts,
+                embeddings=embed_texts(texts).tolist(),
+                metadatas=[chunks[cid][1] for cid in batch],
+            )
+
+        return {"new": len(new_ids), "skipped": len(chunks) - len(new_ids), "removed": len(stale)}
+
+    def query(self, q: str, k=4, company=None, quarter_from=None, quarter_to=None, speaker=None):
+        # company may be one ticker or a list; results from several tickers are merged by distance.
+        companies = [company] if isinstance(company, str) else (company or [self.company])
+        where = build_where(quarter_from, quarter_to, speaker)
         q_emb = embed_texts([q])[0].tolist()
-        res = self.collection.query(query_embeddings=[q_emb], n_results=k)
-        return res["documents"][0] if res["documents"] else []
+        hits = []
+        with span("vector_query"):
+            for c in companies:
+                res = self.collection_for(c).query(query_embeddings=[q_emb], n_results=k, where=where)
+                if res["documents"]:
+                    hits.extend(zip(res["distances"][0], res["documents"][0]))
+        return [doc for _, doc in sorted(hits, key=lambda h: h[0])[:k]]
+
+
+def _qualitative_fields(qual, sentiment="unknown"):
+    return {
+        "themes": list(qual.get("themes") or []),
+        "sentiment": qual.get("sentiment") or sentiment,
+        "forward_looking": list(qual.get("forward_looking") or []),
+    }
+
+
+def combine_quarters(by_quarter):
+    # by_quarter: per-quarter analyses, latest first. The combined fields have the same
+    # shape as a single live analysis; the per-quarter results ride along under by_quarter.
+    themes, seen = [], set()
+    for q in by_quarter:
+        for theme in q.get("themes") or []:
+            key = json.dumps(theme, sort_keys=True)
+            if key not in seen:
+                seen.add(key)
+                themes.append(theme)
+    return {
+        "themes": themes,
+        "sentiment": (by_quarter[0].get("sentiment") or "unknown") if by_quarter else "unknown",
+        "forward_looking": [f for q in by_quarter for f in q.get("forward_looking") or []],
+        "by_quarter": [{"quarter": q.get("quarter"), **_qualitative_fields(q)} for q in by_quarter],
+    }
 
 
 def extract_themes_and_sentiment(snippets: List[str]) -> Dict:
@@ -45,15 +258,11 @@ def extract_themes_and_sentiment(snippets: List[str]) -> Dict:
     )
 
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0,
-        )
-        text = resp.choices[0].message.content
+        with span("theme_analysis"):
+            text = chat(prompt, model="gpt-4o-mini", temperature=0, semantic=True)
         match = re.search(r"(\{.*\})", text, flags=re.S)
         if match:
-            return json.loads(match.group(1))
+            return _qualitative_fields(json.loads(match.group(1)))
     except Exception as e:
         print("Qualitative LLM error:", e)
 
@@ -0,0 +1,77 @@
+# app/utils/append_store.py
+# Append-only float32 matrix plus a JSON-lines log, shared by the embedding cache and the
+# numpy vector store. Each {"op": "put"} record owns the next matrix row; other records
+# (e.g. deletes) are handed to the owner as they are. Writers append under a file lock;
+# readers pick up what other processes appended by reading the log past their offset.
+import numpy as np
+import json
+import os
+
+from .locks import file_lock
+
+
+class AppendOnlyMatrix:
+    def __init__(self, log_path, vectors_path, lock_path):
+        self.log_path = log_path
+        self.vectors_path = vectors_path
+        self.lock_path = lock_path
+        self.offset = 0
+        self.rows = 0
+        self.dim = None
+        self.matrix = None
+
+    def locked(self):
+        return file_lock(self.lock_path)
+
+    def read(self):
+        # Records appended since the last call; each put gets its matrix row as "row".
+        try:
+            if os.path.getsize(self.log_path) == self.offset:
+                return []
+            with open(self.log_path, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return []
+        # A line without its newline is a write in progress; it is read next time.
+        data = data[:data.rfind(b"\n") + 1]
+        self.offset += len(data)
+        records = []
+        for line in data.decode("utf-8").splitlines():
+            rec = json.loads(line)
+            if rec["op"] == "dim":
+                self.dim = rec["dim"]
+                continue
+            if rec["op"] == "put":
+                rec["row"] = self.rows
+                self.rows += 1
+            records.append(rec)
+        return records
+
+    def append(self, vectors, records):
+        # Call with locked() held and after read(), so self.rows counts every logged row.
+        # The puts in `records` match `vectors` row for row; read() returns them afterwards.
+        header = []
+        if vectors is not None and len(vectors):
+            vectors = np.asarray(vectors, dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                header = [{"op": "dim", "dim": self.dim}]
+            with open(self.vectors_path, "ab") as f:
+                # Vectors go first, so a writer that dies leaves rows no record points
+                # at; the next writer drops them before appending its own.
+                expected = self.rows * self.dim * 4
+                if f.seek(0, os.SEEK_END) != expected:
+                    f.truncate(expected)
+                f.write(vectors.tobytes())
+        with open(self.log_path, "ab") as f:
+            f.write("".join(json.dumps(r) + "\n" for r in header + list(records)).encode("utf-8"))
+
+    def view(self):
+        # Read-only map of every logged row, remapped once more rows have been read.
+        if self.matrix is None or self.matrix.shape[0] < self.rows:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        return self.matrix
+
+    def release(self):
+        self.matrix = None
@@ -1,18 +1,242 @@
-
-from sentence_transformers import SentenceTransformer
+from collections import OrderedDict
+from concurrent.futures import Future
 import numpy as np
+import hashlib
+import threading
+import queue
+import time
 import os
 
+from .metrics import span, record, cache_events
+from .append_store import AppendOnlyMatrix
+from . import resources
+
 MODEL = os.getenv("DEFAULT_EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
-_model = None
+CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", 20000))
+# Empty disables the persistent store; otherwise vectors are kept in a memory-mapped
+# float32 matrix under this directory, one sub-directory per model.
+CACHE_DIR = os.getenv("EMBED_CACHE_DIR", "")
+BATCHING = os.getenv("EMBED_BATCHING", "1") != "0"
+BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", 5))
+BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", 64))
+
+stats = {
+    "hits": 0,
+    "disk_hits": 0,
+    "misses": 0,
+    "batches": 0,
+    "batched_texts": 0,
+    "max_batch": 0,
+    "encode_seconds": 0.0,
+    "last_encode_seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(**kwargs):
+    with _stats_lock:
+        for k, v in kwargs.items():
+            stats[k] += v
+
+
+def _create_model():
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(MODEL)
+
+
+resources.register("embedding_model", _create_model)
+
 
 def load_model():
-    global _model
-    if _model is None:
-        _model = SentenceTransformer(MODEL)
-    return _model
+    return resources.get("embedding_model")
 
-def embed_texts(texts):
+
+def text_key(text, model=MODEL):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class _LRU:
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            v = self.data.get(key)
+            if v is not None:
+                self.data.move_to_end(key)
+            return v
+
+    def put(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+
+class _DiskStore:
+    # Vectors by text key in an append-only matrix (see append_store), shared by every
+    # process pointed at the same EMBED_CACHE_DIR.
+    def __init__(self, root, model):
+        self.dir = os.path.join(root, model.replace("/", "__"))
+        os.makedirs(self.dir, exist_ok=True)
+        self.log = AppendOnlyMatrix(
+            os.path.join(self.dir, "rows.log"),
+            os.path.join(self.dir, "vectors.bin"),
+            os.path.join(self.dir, ".lock"),
+        )
+        self.lock = threading.Lock()
+        self.keys = {}
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        for rec in self.log.read():
+            self.keys[rec["key"]] = rec["row"]
+
+    def get(self, key):
+        with self.lock:
+            row = self.keys.get(key)
+            if row is None:
+                self._sync()
+                row = self.keys.get(key)
+                if row is None:
+                    return None
+            return np.array(self.log.view()[row])
+
+    def put_many(self, items):
+        with self.lock, self.log.locked():
+            self._sync()
+            items = list({k: v for k, v in items if k not in self.keys}.items())
+            if not items:
+                return
+            self.log.append(np.stack([v for _, v in items]), [{"op": "put", "key": k} for k, _ in items])
+            self._sync()
+
+
+_lru = _LRU(CACHE_SIZE)
+_store = _DiskStore(CACHE_DIR, MODEL) if CACHE_DIR else None
+
+
+def _encode(texts):
     model = load_model()
-    vectors = model.encode(texts, show_progress_bar=False, convert_to_numpy=True)
-    return vectors.astype(np.float32)
+    start = time.perf_counter()
+    vectors = model.encode(texts, show_progress_bar=False, convert_to_numpy=True).astype(np.float32)
+    elapsed = time.perf_counter() - start
+    record("embedding_encode", elapsed)
+    with _stats_lock:
+        stats["batches"] += 1
+        stats["batched_texts"] += len(texts)
+        stats["max_batch"] = max(stats["max_batch"], len(texts))
+        stats["encode_seconds"] += elapsed
+        stats["last_encode_seconds"] = elapsed
+    return vectors
+
+
+class _Batcher:
+    # Collects embed requests from concurrent callers for up to BATCH_WAIT_MS and
+    # runs them through a single encode call.
+    def __init__(self, wait_ms, max_batch):
+        self.wait = wait_ms / 1000.0
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, texts):
+        fut = Future()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self.thread.start()
+        self.queue.put((texts, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            items = [self.queue.get()]
+            size = len(items[0][0])
+            deadline = time.monotonic() + self.wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                size += len(item[0])
+
+            unique = list(dict.fromkeys(t for texts, _ in items for t in texts))
+            try:
+                vectors = _encode(unique)
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+                continue
+            rows = {t: vectors[i] for i, t in enumerate(unique)}
+            for texts, fut in items:
+                fut.set_result([rows[t] for t in texts])
+
+
+_batcher = _Batcher(BATCH_WAIT_MS, BATCH_MAX)
+
+
+def embed_texts(texts):
+    with span("embedding"):
+        return _embed_texts(texts)
+
+
+def _embed_texts(texts):
+    keys = [text_key(t) for t in texts]
+    found = {}
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key in found or key in missing:
+            continue
+        vec = _lru.get(key)
+        if vec is not None:
+            _count(hits=1)
+            cache_events.inc(cache="embedding", result="hit")
+        elif _store is not None:
+            vec = _store.get(key)
+            if vec is not None:
+                _lru.put(key, vec)
+                _count(disk_hits=1)
+                cache_events.inc(cache="embedding", result="disk_hit")
+        if vec is None:
+            missing[key] = text
+        else:
+            found[key] = vec
+
+    if missing:
+        _count(misses=len(missing))
+        cache_events.inc(len(missing), cache="embedding", result="miss")
+        miss_texts = list(missing.values())
+        if BATCHING:
+            vectors = _batcher.submit(miss_texts).result()
+        else:
+            vectors = list(_encode(miss_texts))
+        for key, vec in zip(missing, vectors):
+            _lru.put(key, vec)
+            found[key] = vec
+        if _store is not None:
+            _store.put_many(list(zip(missing, vectors)))
+
+    if not keys:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([found[k] for k in keys]).astype(np.float32)
+
+
+def embedding_stats():
+    with _stats_lock:
+        s = dict(stats)
+    lookups = s["hits"] + s["disk_hits"] + s["misses"]
+    s["hit_rate"] = (s["hits"] + s["disk_hits"]) / lookups if lookups else 0.0
+    s["avg_batch_size"] = s["batched_texts"] / s["batches"] if s["batches"] else 0.0
+    s["avg_encode_seconds"] = s["encode_seconds"] / s["batches"] if s["batches"] else 0.0
+    return s
@@ -0,0 +1,54 @@
+# app/utils/executors.py
+# One sized thread pool per pipeline stage, so work that outlives its timeout in one
+# stage can't fill the loop's default executor and starve the others. A job that
+# times out while still queued is cancelled; running jobs get a deadline to check.
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import functools
+import threading
+import asyncio
+import time
+import os
+
+STAGE_THREADS = int(os.getenv("STAGE_THREADS", 8))
+DOWNLOAD_THREADS = int(os.getenv("DOWNLOAD_THREADS", os.getenv("HTTP_MAX_CONNECTIONS", 20)))
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def executor(stage):
+    with _lock:
+        pool = _executors.get(stage)
+        if pool is None:
+            size = DOWNLOAD_THREADS if stage == "download" else STAGE_THREADS
+            pool = _executors[stage] = ThreadPoolExecutor(size, thread_name_prefix=f"stage-{stage}")
+        return pool
+
+
+async def run(stage, fn, *args, **kwargs):
+    # Like asyncio.to_thread (the ContextVar timings come along), on the stage's pool.
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(executor(stage), call)
+
+
+def deadline_after(timeout):
+    return None if timeout is None else time.monotonic() + timeout
+
+
+def remaining(deadline):
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+def check_deadline(deadline, stage):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise TimeoutError(f"{stage} deadline exceeded")
+
+
+def shutdown_executors():
+    with _lock:
+        pools = list(_executors.values())
+        _executors.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
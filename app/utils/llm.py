@@ -0,0 +1,226 @@
+# app/utils/llm.py
+from collections import OrderedDict
+from dotenv import load_dotenv
+import numpy as np
+import threading
+import hashlib
+import time
+import os
+
+from .metrics import record, cache_events, llm_tokens
+from . import resources
+
+load_dotenv()
+OPENAI_KEY = os.getenv("OPENAI_API_KEY")
+DEFAULT_MODEL = os.getenv("DEFAULT_LLM_MODEL", "gpt-4o-mini")
+
+LLM_CACHE = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 1000))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 24 * 3600))
+# The semantic tier reuses answers for prompts whose embeddings are nearly identical.
+# Embeddings only see the start of long prompts, so it applies only to calls that pass
+# semantic=True (themes, synthesis), never to document extraction, and only when enabled.
+LLM_SEMANTIC_CACHE = os.getenv("LLM_SEMANTIC_CACHE", "0") == "1"
+LLM_SEMANTIC_THRESHOLD = float(os.getenv("LLM_SEMANTIC_THRESHOLD", 0.97))
+
+
+def _create_client():
+    from openai import OpenAI
+
+    return OpenAI(api_key=OPENAI_KEY)
+
+
+resources.register("openai", _create_client, available=lambda: bool(OPENAI_KEY))
+
+
+def get_client():
+    return resources.get("openai")
+
+
+stats = {
+    "calls": 0,
+    "hits": 0,
+    "semantic_hits": 0,
+    "misses": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "tokens_saved": 0,
+    "latency_seconds": 0.0,
+    "latency_saved_seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def _count(**kwargs):
+    with _stats_lock:
+        for k, v in kwargs.items():
+            stats[k] += v
+
+
+def cache_key(prompt, model, temperature, max_tokens):
+    blob = f"{model}\0{temperature}\0{max_tokens}\0{prompt}".encode("utf-8")
+    return hashlib.sha256(blob).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, size=LLM_CACHE_SIZE, ttl=LLM_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expired(self, entry):
+        return time.time() - entry["created"] > self.ttl
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def find_similar(self, scope, vector, threshold):
+        with self.lock:
+            best, best_score = None, threshold
+            for key, entry in list(self.entries.items()):
+                if self._expired(entry):
+                    del self.entries[key]
+                    continue
+                if entry["scope"] != scope or entry.get("vector") is None:
+                    continue
+                score = float(np.dot(entry["vector"], vector))
+                if score >= best_score:
+                    best, best_score = key, score
+            if best is None:
+                return None
+            self.entries.move_to_end(best)
+            return self.entries[best]
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = {**entry, "created": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+response_cache = ResponseCache()
+
+
+def _prompt_vector(prompt):
+    from .embeddings import embed_texts
+
+    vec = embed_texts([prompt])[0]
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+def _lookup(prompt, key, scope, temperature, semantic):
+    entry = response_cache.get(key)
+    if entry is not None:
+        _count(hits=1, tokens_saved=entry["tokens"], latency_saved_seconds=entry["latency"])
+        cache_events.inc(cache="llm", result="hit")
+        return entry, None
+    vector = None
+    if semantic and LLM_SEMANTIC_CACHE and temperature == 0:
+        vector = _prompt_vector(prompt)
+        entry = response_cache.find_similar(scope, vector, LLM_SEMANTIC_THRESHOLD)
+        if entry is not None:
+            _count(semantic_hits=1, tokens_saved=entry["tokens"], latency_saved_seconds=entry["latency"])
+            cache_events.inc(cache="llm", result="semantic_hit")
+            return entry, vector
+    cache_events.inc(cache="llm", result="miss")
+    return None, vector
+
+
+def _store(key, scope, vector, text, usage, latency, cache):
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    _count(misses=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, latency_seconds=latency)
+    llm_tokens.inc(prompt_tokens, kind="prompt")
+    llm_tokens.inc(completion_tokens, kind="completion")
+    record("llm_request", latency)
+    if cache and text:
+        response_cache.put(key, {
+            "text": text,
+            "scope": scope,
+            "vector": vector,
+            "tokens": prompt_tokens + completion_tokens,
+            "latency": latency,
+        })
+
+
+def chat(prompt, model=DEFAULT_MODEL, temperature=0.0, max_tokens=None, cache=LLM_CACHE, semantic=False, timeout=None):
+    _count(calls=1)
+    key = cache_key(prompt, model, temperature, max_tokens)
+    scope = (model, temperature, max_tokens)
+    vector = None
+    if cache:
+        entry, vector = _lookup(prompt, key, scope, temperature, semantic)
+        if entry is not None:
+            return entry["text"]
+
+    kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+    if timeout:
+        kwargs["timeout"] = timeout
+    start = time.perf_counter()
+    resp = get_client().chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        **kwargs,
+    )
+    text = resp.choices[0].message.content
+    _store(key, scope, vector, text, getattr(resp, "usage", None), time.perf_counter() - start, cache)
+    return text
+
+
+def stream_chat(prompt, model=DEFAULT_MODEL, temperature=0.0, max_tokens=None, cache=LLM_CACHE, semantic=False, timeout=None):
+    # Yields text deltas as the model produces them; a cached answer comes back as one delta.
+    _count(calls=1)
+    key = cache_key(prompt, model, temperature, max_tokens)
+    scope = (model, temperature, max_tokens)
+    vector = None
+    if cache:
+        entry, vector = _lookup(prompt, key, scope, temperature, semantic)
+        if entry is not None:
+            yield entry["text"]
+            return
+
+    kwargs = {"max_tokens": max_tokens} if max_tokens else {}
+    if timeout:
+        kwargs["timeout"] = timeout
+    start = time.perf_counter()
+    stream = get_client().chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+        **kwargs,
+    )
+    parts, usage = [], None
+    for chunk in stream:
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+            yield parts[-1]
+    _store(key, scope, vector, "".join(parts), usage, time.perf_counter() - start, cache)
+
+
+def llm_stats():
+    with _stats_lock:
+        s = dict(stats)
+    lookups = s["hits"] + s["semantic_hits"] + s["misses"]
+    s["hit_rate"] = (s["hits"] + s["semantic_hits"]) / lookups if lookups else 0.0
+    s["cache_entries"] = len(response_cache.entries)
+    return s
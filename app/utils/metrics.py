@@ -0,0 +1,210 @@
+# app/utils/metrics.py
+# Minimal Prometheus-style counters/histograms plus per-request stage timings.
+# Timings live in a ContextVar, so to_thread/executors.run workers record into the request
+# that started them; threads and processes without that context only feed histograms.
+from contextlib import contextmanager
+import contextvars
+import threading
+import bisect
+import time
+import io
+import os
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = "x-profile"
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    inner = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + inner + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self.lock:
+            entry = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bucket_labels = self.labels + ("le",)
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_labels(bucket_labels, key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(bucket_labels, key + ('+Inf',))} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    # Read from a callback at scrape time, for stats other modules already keep.
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+_registry = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+stage_seconds = register(Histogram("forecast_stage_seconds", "Time spent per pipeline stage.", ("stage",)))
+stage_errors = register(Counter("forecast_stage_errors_total", "Failures and timeouts per pipeline stage.", ("stage",)))
+cache_events = register(Counter("forecast_cache_events_total", "Cache lookups by cache and result.", ("cache", "result")))
+llm_tokens = register(Counter("forecast_llm_tokens_total", "LLM tokens used, by prompt/completion.", ("kind",)))
+extraction_methods = register(Counter("forecast_extraction_method_total", "Metric extraction path taken.", ("method",)))
+
+_timings = contextvars.ContextVar("forecast_timings", default=None)
+# Worker threads get a copy of the context, so concurrent downloads/embeddings share one dict.
+_timings_lock = threading.Lock()
+# One profiled request at a time: profilers hook the whole thread, and on 3.12+ a
+# second cProfile raises "Another profiling tool is already active".
+_profile_lock = threading.Lock()
+
+
+def start_request():
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def record(stage, seconds):
+    stage_seconds.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        # Stages that run more than once per request (downloads, embeddings) accumulate.
+        with _timings_lock:
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 6)
+
+
+def record_error(stage):
+    stage_errors.inc(stage=stage)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(stage)
+        raise
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def profiling_requested(headers):
+    return PROFILING_ENABLED and headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes")
+
+
+@contextmanager
+def profile(enabled):
+    # Samples the event-loop thread; pyinstrument follows awaits, cProfile is the fallback.
+    if not enabled:
+        yield None
+        return
+    if not _profile_lock.acquire(blocking=False):
+        yield {"error": "another profiled request is in progress"}
+        return
+    result = {}
+    try:
+        with _profile(result):
+            yield result
+    finally:
+        _profile_lock.release()
+
+
+@contextmanager
+def _profile(result):
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            result.update(profiler="pyinstrument", report=profiler.output_text())
+        return
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Another tool (a debugger, coverage) already holds the profiling hook.
+        result["error"] = str(e)
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+        result.update(profiler="cProfile", report=out.getvalue())
@@ -0,0 +1,34 @@
+# app/utils/quarters.py
+# Quarter labels parsed from document/transcript titles, plus a sortable index so
+# retrieval can filter on quarter ranges. Fiscal years run April-March.
+import re
+
+MONTHS = ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec")
+
+
+def quarter_label(title):
+    m = re.search(r"(?<![a-z])(Q[1-4])(?!\d)(?:\s*(?:FY)?\s*'?(\d{2,4}))?", title, flags=re.I)
+    if m:
+        return f"{m.group(1).upper()} FY{m.group(2)}" if m.group(2) else m.group(1).upper()
+    m = re.search(r"\b(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+(\d{4})\b", title, flags=re.I)
+    if m:
+        return f"{m.group(1).title()} {m.group(2)}"
+    return title
+
+
+def quarter_index(label):
+    # fiscal_year * 4 + (quarter - 1); a bare "Q2" counts as year 0, anything unparseable is -1.
+    if isinstance(label, int):
+        return label
+    m = re.fullmatch(r"Q([1-4])(?: FY(\d{2,4}))?", label or "")
+    if m:
+        year = int(m.group(2) or 0)
+        if m.group(2) and len(m.group(2)) == 2:
+            year += 2000
+        return year * 4 + int(m.group(1)) - 1
+    m = re.fullmatch(r"([A-Z][a-z]{2}) (\d{4})", label or "")
+    if m and m.group(1).lower() in MONTHS:
+        month = MONTHS.index(m.group(1).lower()) + 1
+        year = int(m.group(2)) + (1 if month >= 4 else 0)
+        return year * 4 + ((month - 4) % 12) // 3
+    return -1
@@ -0,0 +1,86 @@
+# app/utils/resources.py
+# Process-wide heavy clients and models, created on first use so importing the app
+# stays cheap. Owning modules register a factory that does its own heavy import.
+import threading
+import time
+
+_factories = {}
+_available = {}
+_resources = {}
+_locks = {}
+_lock = threading.Lock()
+
+warmup_state = {"status": "pending", "seconds": {}, "errors": {}, "required": [], "skipped": []}
+
+
+def register(name, factory, available=None):
+    # `available` says whether the resource is configured at all (e.g. an API key is
+    # set); unavailable ones are skipped by warm-up and don't hold up readiness.
+    _factories[name] = factory
+    _available[name] = available or (lambda: True)
+    _locks[name] = threading.Lock()
+    return factory
+
+
+def get(name):
+    resource = _resources.get(name)
+    if resource is None:
+        with _locks[name]:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = _resources[name] = _factories[name]()
+    return resource
+
+
+def provide(name, resource):
+    # Swaps in a ready-made instance, e.g. a fake model for benchmarks.
+    _resources[name] = resource
+
+
+def loaded(name):
+    return name in _resources
+
+
+def status():
+    state = {**warmup_state, "loaded": sorted(_resources)}
+    # A resource that failed to warm up may load later on first use; readiness follows.
+    if state["status"] == "failed" and all(loaded(name) for name in state["required"]):
+        state["status"] = "ready"
+    return state
+
+
+def reset(name=None):
+    with _lock:
+        if name is None:
+            _resources.clear()
+        else:
+            _resources.pop(name, None)
+
+
+def warm_up(names=None, retries=0, retry_delay=5.0):
+    # Blocking; call through asyncio.to_thread from the event loop. Failures are kept
+    # in warmup_state so one missing dependency doesn't hide the others, and failed
+    # resources are retried so a transient error (a model download hiccup) recovers.
+    names = names or list(_factories)
+    required = [name for name in names if _available[name]()]
+    warmup_state.update(
+        status="warming", seconds={}, errors={},
+        required=required, skipped=[name for name in names if name not in required],
+    )
+    for attempt in range(retries + 1):
+        failing = [name for name in required if not loaded(name)]
+        if not failing:
+            break
+        if attempt:
+            time.sleep(retry_delay * attempt)
+        for name in failing:
+            start = time.perf_counter()
+            try:
+                get(name)
+                warmup_state["errors"].pop(name, None)
+            except Exception as e:
+                print(f"Warm-up error ({name}):", e)
+                warmup_state["errors"][name] = str(e)
+            warmup_state["seconds"][name] = round(time.perf_counter() - start, 3)
+    warmup_state["status"] = "failed" if warmup_state["errors"] else "ready"
+    return warmup_state
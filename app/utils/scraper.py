@@ -1,14 +1,71 @@
 # app/utils/scraper.py
 import requests
+from requests.adapters import HTTPAdapter
+import httpx
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import Future
+import threading
+import hashlib
+import json
+import time
+import re
 import os
 
-def fetch_screener_docs(ticker_url="https://www.screener.in/company/TCS/consolidated/#documents"):
-    
-    r = requests.get(ticker_url, timeout=30)
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, "html.parser")
+from .metrics import cache_events
+from .executors import run, deadline_after, remaining, check_deadline
+
+SCREENER_URL = os.getenv("SCREENER_URL", "https://www.screener.in/company/TCS/consolidated/#documents")
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))
+DISCOVERY_TTL = float(os.getenv("DISCOVERY_TTL", 3600))
+MANIFEST_NAME = "manifest.json"
+
+_async_client = None
+_session = None
+_session_lock = threading.Lock()
+
+_discovery = {}
+_discovery_lock = threading.Lock()
+
+_manifests = {}
+_manifest_lock = threading.Lock()
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        )
+    return _async_client
+
+
+async def aclose_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=HTTP_MAX_CONNECTIONS, pool_maxsize=HTTP_MAX_CONNECTIONS)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def parse_screener_docs(html, ticker_url):
+    soup = BeautifulSoup(html, "html.parser")
     results = []
     for a in soup.select("table.documents a"):
         href = a.get("href")
@@ -18,13 +75,174 @@ def fetch_screener_docs(ticker_url="https://www.screener.in/company/TCS/consolid
             results.append({"title": title, "url": url})
     return results
 
-def download_file(url, dest_folder="data"):
+
+def _local_path(url, dest_folder):
+    # Screener links share a basename (AnnPdfOpen.aspx?Pname=<id>.pdf), so the file is
+    # named by a hash of the full URL; the extension comes from the query when it has one.
+    parts = urlsplit(url)
+    stem, ext = os.path.splitext(os.path.basename(parts.path))
+    m = re.search(r"(\.[A-Za-z0-9]{1,5})$", parts.query)
+    if m:
+        ext = m.group(1)
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(dest_folder, f"{stem or 'document'}-{digest}{ext.lower()}")
+
+
+def _cached_docs(ticker_url):
+    with _discovery_lock:
+        entry = _discovery.get(ticker_url)
+        if entry and time.monotonic() - entry[0] < DISCOVERY_TTL:
+            cache_events.inc(cache="discovery", result="hit")
+            return list(entry[1])
+        cache_events.inc(cache="discovery", result="miss")
+        return None
+
+
+def _store_docs(ticker_url, docs):
+    with _discovery_lock:
+        _discovery[ticker_url] = (time.monotonic(), list(docs))
+
+
+def clear_discovery_cache():
+    with _discovery_lock:
+        _discovery.clear()
+
+
+def discover_docs(ticker_url=SCREENER_URL):
+    docs = _cached_docs(ticker_url)
+    if docs is not None:
+        return docs, "hit"
+    r = get_session().get(ticker_url, timeout=30)
+    r.raise_for_status()
+    docs = parse_screener_docs(r.text, ticker_url)
+    _store_docs(ticker_url, docs)
+    return docs, "miss"
+
+
+def fetch_screener_docs(ticker_url=SCREENER_URL):
+    return discover_docs(ticker_url)[0]
+
+
+def _manifest(dest_folder):
+    manifest = _manifests.get(dest_folder)
+    if manifest is None:
+        try:
+            with open(os.path.join(dest_folder, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        _manifests[dest_folder] = manifest
+    return manifest
+
+
+def _record(dest_folder, url, entry):
+    with _manifest_lock:
+        manifest = _manifest(dest_folder)
+        manifest[url] = entry
+        path = os.path.join(dest_folder, MANIFEST_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+
+def _download(url, dest_folder, path, deadline=None):
     os.makedirs(dest_folder, exist_ok=True)
-    local_filename = url.split("/")[-1].split("?")[0]
-    path = os.path.join(dest_folder, local_filename)
-    with requests.get(url, stream=True, timeout=60) as r:
+    with _manifest_lock:
+        entry = _manifest(dest_folder).get(url)
+
+    headers = {}
+    if entry and os.path.exists(path) and os.path.getsize(path) == entry.get("size"):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    timeout = 60 if deadline is None else min(60, max(remaining(deadline), 0.001))
+    with get_session().get(url, stream=True, timeout=timeout, headers=headers) as r:
+        if r.status_code == 304 and headers:
+            cache_events.inc(cache="download", result="hit")
+            return {"path": path, "cache": "hit", "sha256": entry.get("sha256")}
         r.raise_for_status()
-        with open(path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
-    return path
+        digest = hashlib.sha256()
+        size = 0
+        tmp = f"{path}.{os.getpid()}.part"
+        try:
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size=8192):
+                    # Past the caller's deadline nobody will use the file; stop reading.
+                    check_deadline(deadline, "download")
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        os.replace(tmp, path)
+        etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+    cache_events.inc(cache="download", result="miss")
+    _record(dest_folder, url, {
+        "path": path,
+        "etag": etag,
+        "last_modified": last_modified,
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "fetched_at": time.time(),
+    })
+    return {"path": path, "cache": "miss", "sha256": digest.hexdigest()}
+
+
+def fetch_document(url, dest_folder="data", deadline=None):
+    # Concurrent calls for the same file wait on the first caller's download.
+    key = _local_path(url, dest_folder)
+    with _inflight_lock:
+        fut = _inflight.get(key)
+        leader = fut is None
+        if leader:
+            fut = _inflight[key] = Future()
+    if not leader:
+        cache_events.inc(cache="download", result="shared")
+        return {**fut.result(timeout=remaining(deadline)), "shared": True}
+
+    try:
+        result = _download(url, dest_folder, key, deadline)
+    except Exception as e:
+        fut.set_exception(e)
+        raise
+    else:
+        fut.set_result(result)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+    return result
+
+
+def download_file(url, dest_folder="data"):
+    return fetch_document(url, dest_folder)["path"]
+
+
+async def async_discover_docs(client=None, ticker_url=SCREENER_URL):
+    docs = _cached_docs(ticker_url)
+    if docs is not None:
+        return docs, "hit"
+    client = client or get_async_client()
+    r = await client.get(ticker_url, timeout=30)
+    r.raise_for_status()
+    docs = parse_screener_docs(r.text, ticker_url)
+    _store_docs(ticker_url, docs)
+    return docs, "miss"
+
+
+async def async_fetch_screener_docs(client=None, ticker_url=SCREENER_URL):
+    return (await async_discover_docs(client, ticker_url))[0]
+
+
+async def async_fetch_document(url, dest_folder="data", timeout=None):
+    return await run("download", fetch_document, url, dest_folder, deadline_after(timeout))
+
+
+async def async_download_file(url, dest_folder="data"):
+    return (await async_fetch_document(url, dest_folder))["path"]
@@ -0,0 +1,247 @@
+# app/utils/vector_store.py
+# Exact-search fallback for small corpora: each collection is a memory-mapped float32
+# matrix plus a log of ids/documents/metadata, queried with a top-k dot product.
+# Implements the subset of the Chroma collection API that QualitativeAnalysisTool uses,
+# including Chroma-style `where` filters ($and/$or, $eq/$ne, $gt/$gte/$lt/$lte, $in/$nin).
+import numpy as np
+import threading
+import os
+
+from .append_store import AppendOnlyMatrix
+from .locks import file_lock
+
+_RANGE = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+class NumpyCollection:
+    # An append-only matrix (see append_store) per generation: rows-<gen>.log records
+    # upserts and deletes, vectors-<gen>.bin the rows. Re-upserted and deleted rows go
+    # dead and are dropped when the files are compacted into the next generation.
+    def __init__(self, root, name):
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.lock_path = os.path.join(self.dir, ".lock")
+        self.generation_path = os.path.join(self.dir, "GENERATION")
+        self.lock = threading.Lock()
+        self.generation = None
+        os.makedirs(self.dir, exist_ok=True)
+        with self.lock:
+            self._sync()
+
+    def _open(self, generation):
+        return AppendOnlyMatrix(
+            os.path.join(self.dir, f"rows-{generation}.log"),
+            os.path.join(self.dir, f"vectors-{generation}.bin"),
+            self.lock_path,
+        )
+
+    def _reset(self, generation):
+        self.generation = generation
+        self.log = self._open(generation)
+        # Per physical row; self.rows maps each live id to its latest row.
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.live = np.zeros(0, dtype=bool)
+        self.rows = {}
+        self.columns = {}
+
+    def _read_generation(self):
+        try:
+            with open(self.generation_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _sync(self):
+        generation = self._read_generation()
+        if generation != self.generation:
+            self._reset(generation)
+        records = self.log.read()
+        if not records:
+            return
+        dead, born = [], 0
+        for rec in records:
+            if rec["op"] == "put":
+                old = self.rows.get(rec["id"])
+                if old is not None:
+                    dead.append(old)
+                self.rows[rec["id"]] = rec["row"]
+                self.ids.append(rec["id"])
+                self.documents.append(rec.get("document"))
+                self.metadatas.append(rec.get("metadata") or {})
+                born += 1
+            elif rec["op"] == "del":
+                for cid in rec["ids"]:
+                    old = self.rows.pop(cid, None)
+                    if old is not None:
+                        dead.append(old)
+        if born:
+            self.live = np.concatenate([self.live, np.ones(born, dtype=bool)])
+        if dead:
+            self.live[dead] = False
+        self.columns = {}
+
+    def count(self):
+        with self.lock:
+            self._sync()
+            return len(self.rows)
+
+    def _column(self, key, numeric):
+        # Metadata values as arrays, rebuilt lazily after writes, so filters are vectorised.
+        col = self.columns.get((key, numeric))
+        if col is None:
+            values = [m.get(key) for m in self.metadatas]
+            if numeric:
+                values = [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values]
+                col = np.array(values, dtype=np.float64)
+            else:
+                col = np.empty(len(values), dtype=object)
+                col[:] = values
+            self.columns[(key, numeric)] = col
+        return col
+
+    def _mask(self, where):
+        mask = np.ones(len(self.ids), dtype=bool)
+        for key, cond in (where or {}).items():
+            if key == "$and":
+                for c in cond:
+                    mask &= self._mask(c)
+            elif key == "$or":
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for c in cond:
+                    any_mask |= self._mask(c)
+                mask &= any_mask
+            elif not isinstance(cond, dict):
+                mask &= self._column(key, False) == cond
+            else:
+                for op, value in cond.items():
+                    if op in _RANGE:
+                        mask &= _RANGE[op](self._column(key, True), value)
+                    elif op in ("$eq", "$ne"):
+                        eq = self._column(key, False) == value
+                        mask &= eq if op == "$eq" else ~eq
+                    elif op in ("$in", "$nin"):
+                        col = self._column(key, False)
+                        found = np.zeros(len(self.ids), dtype=bool)
+                        for v in value:
+                            found |= col == v
+                        mask &= found if op == "$in" else ~found
+                    else:
+                        raise ValueError(f"Unsupported where operator: {op}")
+        return mask
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None):
+        records = [
+            {
+                "op": "put",
+                "id": cid,
+                "document": documents[i] if documents else None,
+                "metadata": metadatas[i] if metadatas else {},
+            }
+            for i, cid in enumerate(ids)
+        ]
+        with self.lock, file_lock(self.lock_path):
+            self._sync()
+            self.log.append(embeddings, records)
+            self._sync()
+            self._maybe_compact()
+
+    def delete(self, ids=None, where=None):
+        with self.lock, file_lock(self.lock_path):
+            self._sync()
+            drop = [cid for cid in dict.fromkeys(ids or ()) if cid in self.rows]
+            if where:
+                drop.extend(self.ids[i] for i in np.flatnonzero(self.live & self._mask(where)) if self.ids[i] not in drop)
+            if not drop:
+                return
+            self.log.append(None, [{"op": "del", "ids": drop}])
+            self._sync()
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        # Called with both locks held. Rewriting only once dead rows outnumber live
+        # ones keeps the amortised cost per write constant.
+        dead = len(self.ids) - len(self.rows)
+        if dead <= max(1024, len(self.rows)):
+            return
+        old = self.log
+        new = self._open(self.generation + 1)
+        keep = sorted(self.rows.values())
+        matrix = old.view()
+        for start in range(0, len(keep), 4096):
+            chunk = keep[start:start + 4096]
+            new.append(matrix[chunk], [
+                {"op": "put", "id": self.ids[row], "document": self.documents[row], "metadata": self.metadatas[row]}
+                for row in chunk
+            ])
+            new.read()
+        tmp = self.generation_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(self.generation + 1))
+        os.replace(tmp, self.generation_path)
+        del matrix
+        old.release()
+        self._sync()
+        for path in (old.log_path, old.vectors_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # still mapped by another process (Windows); harmless leftover
+
+    def _select(self, ids=None, where=None):
+        mask = self.live & self._mask(where)
+        if ids is None:
+            return np.flatnonzero(mask)
+        return [row for row in (self.rows.get(cid) for cid in ids) if row is not None and mask[row]]
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        with self.lock:
+            self._sync()
+            rows = self._select(ids, where)
+            result = {"ids": [self.ids[i] for i in rows]}
+            if "documents" in include:
+                result["documents"] = [self.documents[i] for i in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self.metadatas[i] for i in rows]
+            return result
+
+    def query(self, query_embeddings, n_results=10, where=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        out = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self.lock:
+            self._sync()
+            rows = self._select(where=where)
+            matrix = self.log.view() if len(rows) else None
+            for q in queries:
+                if matrix is None:
+                    top, scores = [], []
+                else:
+                    # Scoring every row and then indexing beats copying the filtered rows out.
+                    scores = (matrix @ q)[rows]
+                    k = min(n_results, len(rows))
+                    best = np.argpartition(-scores, k - 1)[:k]
+                    best = best[np.argsort(-scores[best])]
+                    top, scores = rows[best], scores[best]
+                out["ids"].append([self.ids[i] for i in top])
+                out["documents"].append([self.documents[i] for i in top])
+                out["metadatas"].append([self.metadatas[i] for i in top])
+                out["distances"].append([float(1.0 - s) for s in scores])
+        return out
+
+
+class NumpyStore:
+    # Client-shaped wrapper so the tool can swap it in for a Chroma client.
+    def __init__(self, root):
+        self.root = root
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def get_or_create_collection(self, name):
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = NumpyCollection(self.root, name)
+            return self.collections[name]
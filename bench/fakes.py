@@ -0,0 +1,138 @@
+# bench/fakes.py
+# Local stand-ins for screener.in (document list + PDFs) and the OpenAI chat
+# completions API, served from one threaded HTTP server.
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import hashlib
+import json
+import time
+import os
+
+LAST_MODIFIED = "Mon, 01 Jan 2024 00:00:00 GMT"
+
+
+def fake_completion(prompt):
+    # Deterministic answers shaped like what each call site parses.
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    if "Extract Total Revenue" in prompt:
+        body = {"total_revenue": f"{200000 + seed % 50000} crore", "net_profit": f"{40000 + seed % 9000} crore", "operating_margin": f"{22 + seed % 5}.0%"}
+    elif "Analyze these transcript excerpts" in prompt:
+        body = {"themes": ["digital demand", "margin discipline"], "sentiment": "cautiously optimistic", "forward_looking": ["moderate growth"]}
+    else:
+        body = {
+            "financial_trends": {"revenue": "growing", "margin": "stable"},
+            "management_outlook": {"tone": "confident"},
+            "risks": ["wage inflation", "currency volatility"],
+            "opportunities": ["cloud transformation", "European deal wins"],
+            "forecast_summary": f"Steady growth expected (ref {seed % 1000}).",
+        }
+    return json.dumps(body, indent=2)
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "bench-fake/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/json", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0].split("#")[0]
+        if path.startswith("/company/"):
+            rows = "".join(
+                f'<tr><td><a href="/docs/{d["name"]}">{d["title"]}</a></td></tr>' for d in self.server.documents
+            )
+            html = f'<html><body><table class="documents">{rows}</table></body></html>'
+            return self._send(200, html.encode("utf-8"), "text/html; charset=utf-8")
+
+        if path.startswith("/docs/"):
+            name = os.path.basename(path)
+            full = os.path.join(self.server.docs_dir, name)
+            if not os.path.exists(full):
+                return self._send(404)
+            with open(full, "rb") as f:
+                data = f.read()
+            etag = '"%s"' % hashlib.sha256(data).hexdigest()[:16]
+            headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED}
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers=headers)
+            return self._send(200, data, "application/pdf", headers)
+
+        self._send(404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            return self._send(404)
+
+        prompt = payload["messages"][-1]["content"]
+        text = fake_completion(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        latency = self.server.llm_latency
+        base = {"id": "chatcmpl-bench", "created": int(time.time()), "model": payload.get("model", "bench")}
+
+        if not payload.get("stream"):
+            time.sleep(latency)
+            body = {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+            return self._send(200, json.dumps(body).encode("utf-8"))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [text[i:i + 24] for i in range(0, len(text), 24)]
+        chunks = [
+            {**base, "object": "chat.completion.chunk",
+             "choices": [{"index": 0, "delta": {"content": p}, "finish_reason": None}]}
+            for p in pieces
+        ]
+        chunks.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        for chunk in chunks:
+            time.sleep(latency / max(len(chunks), 1))
+            self._chunk(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n" % len(data) + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeServer:
+    def __init__(self, docs_dir, documents, llm_latency=0.2, host="127.0.0.1", port=0):
+        self.httpd = ThreadingHTTPServer((host, port), FakeHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.docs_dir = docs_dir
+        self.httpd.documents = documents
+        self.httpd.llm_latency = llm_latency
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="bench-fake-server", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,84 @@
+# bench/fixtures.py
+# Writes small, valid multi-page PDFs with plain Helvetica text so pdfplumber has
+# something realistic to parse without shipping binary fixtures.
+import os
+import random
+
+FILLER = [
+    "The Company continued to invest in talent, capabilities and client relationships.",
+    "Segment performance reflected broad based demand across verticals and geographies.",
+    "Attrition moderated during the period and utilisation remained in a healthy band.",
+    "Cash conversion stayed strong with free cash flow above net income for the quarter.",
+    "The Board reviewed capital allocation including dividends and buyback programmes.",
+    "Order book remained robust with large deal wins in banking, retail and manufacturing.",
+]
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for lines in pages:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        " ".join(f"{k} 0 R" for k in kids).encode(), len(kids)
+    )
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def report_pages(n_pages, metrics_page=0, seed=0, lines_per_page=60):
+    # metrics_page controls where the three metrics appear, which decides how far
+    # the early-stopping extractor has to read.
+    rng = random.Random(seed)
+    pages = []
+    for p in range(n_pages):
+        lines = [rng.choice(FILLER) for _ in range(lines_per_page)]
+        if p == metrics_page:
+            revenue = 200000 + rng.randint(0, 60000)
+            lines[5] = f"Total revenue for the quarter stood at {revenue:,} crore."
+            lines[9] = f"Net profit for the quarter was {revenue // 5:,} crore."
+            lines[13] = f"Operating margin for the quarter was {rng.uniform(22, 27):.1f}%."
+        pages.append(lines)
+    return pages
+
+
+def write_fixtures(dest, count=4, pages=40, metrics_page=None):
+    os.makedirs(dest, exist_ok=True)
+    files = []
+    for i in range(count):
+        where = metrics_page if metrics_page is not None else i * pages // max(count, 1)
+        data = make_pdf(report_pages(pages, metrics_page=where, seed=i))
+        name = f"Q{i % 4 + 1}_FY{25 - i // 4}_results.pdf"
+        with open(os.path.join(dest, name), "wb") as f:
+            f.write(data)
+        files.append({"title": f"Q{i % 4 + 1} FY{25 - i // 4} results", "name": name})
+    return files
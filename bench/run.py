@@ -0,0 +1,306 @@
+# bench/run.py
+# Offline benchmark for the /forecast pipeline.
+#
+#   python -m bench.run --requests 20 --concurrency 4 --save bench/baseline.json
+#   python -m bench.run --compare bench/baseline.json
+#
+# Everything external is replaced locally: screener.in and the PDFs come from
+# bench.fakes, OpenAI is the fake chat endpoint, MySQL is the SQLite backend and,
+# unless --real-embeddings is given, SentenceTransformer is a hashing encoder.
+import multiprocessing
+import subprocess
+import argparse
+import tempfile
+import asyncio
+import hashlib
+import json
+import time
+import sys
+import os
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("pdf_parse", "extract", "embedding", "synthesis", "db_log")
+
+
+def percentiles(samples):
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(1000 * sum(ordered) / len(ordered), 3),
+        "p50_ms": round(1000 * pick(0.50), 3),
+        "p95_ms": round(1000 * pick(0.95), 3),
+        "p99_ms": round(1000 * pick(0.99), 3),
+    }
+
+
+def peak_rss_mb():
+    if resource is not None:
+        # ru_maxrss is KiB on Linux and bytes on macOS.
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    info = psutil.Process().memory_info()
+    # peak_wset is the Windows peak working set; elsewhere only the current RSS is known.
+    return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+
+
+class HashingEncoder:
+    # Drop-in for SentenceTransformer.encode: deterministic, no model download.
+    dim = 384
+
+    def encode(self, texts, show_progress_bar=False, convert_to_numpy=True):
+        import numpy as np
+
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.lower().split():
+                h = int(hashlib.md5(token.encode("utf-8")).hexdigest()[:8], 16)
+                out[i, h % self.dim] += 1.0
+            norm = np.linalg.norm(out[i])
+            if norm:
+                out[i] /= norm
+        return out
+
+
+def configure_env(workdir, base_url, args):
+    os.environ.update({
+        "SCREENER_URL": f"{base_url}/company/TCS/consolidated/#documents",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "bench",
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": os.path.join(workdir, "bench.sqlite3"),
+        "REFRESH_ON_STARTUP": "0",
+        "USE_ARTIFACTS": "1" if args.artifacts else "0",
+        "PDF_WORKERS": str(args.pdf_workers),
+    })
+    if args.cold:
+        os.environ.update({"EXTRACT_CACHE": "0", "LLM_CACHE": "0"})
+
+
+def install_fakes(args):
+    if not args.real_embeddings:
+        from app.utils import resources
+
+        resources.provide("embedding_model", HashingEncoder())
+
+
+def _stage_worker(stage, workdir, base_url, args, conn):
+    # Runs in a fresh spawned process so peak RSS belongs to this stage alone.
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    configure_env(workdir, base_url, args)
+    os.environ.update({"EXTRACT_CACHE": "0", "LLM_CACHE": "0", "EMBED_CACHE_SIZE": "1"})
+    install_fakes(args)
+    samples = []
+    pdfs = sorted(os.path.join(workdir, "docs", f) for f in os.listdir(os.path.join(workdir, "docs")))
+
+    for i in range(args.stage_iterations):
+        if stage == "pdf_parse":
+            from app.tools.financial_data_extractor import extract_text_from_pdf
+            start = time.perf_counter()
+            extract_text_from_pdf(pdfs[i % len(pdfs)])
+        elif stage == "extract":
+            from app.tools.financial_data_extractor import extract_metrics_from_pdf
+            start = time.perf_counter()
+            extract_metrics_from_pdf(pdfs[i % len(pdfs)])
+        elif stage == "embedding":
+            from app.utils.embeddings import embed_texts
+            texts = [f"bench passage {i} {j} on demand, margins and deal wins" for j in range(32)]
+            start = time.perf_counter()
+            embed_texts(texts)
+        elif stage == "synthesis":
+            from app.utils.llm import chat
+            start = time.perf_counter()
+            chat(f"Context {i}: summarise the outlook.", model="gpt-4o-mini", temperature=0.0, semantic=True)
+        elif stage == "db_log":
+            from app.database.mysql_logger import log_request, flush_logs
+            start = time.perf_counter()
+            log_request(f"bench-{i}", "query", json.dumps({"i": i, "pad": "x" * 20000}))
+            flush_logs()
+        samples.append(time.perf_counter() - start)
+
+    conn.send({"latency": percentiles(samples), "peak_rss_mb": peak_rss_mb()})
+    conn.close()
+
+
+def run_stage(stage, workdir, base_url, args):
+    ctx = multiprocessing.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_stage_worker, args=(stage, workdir, base_url, args, child))
+    proc.start()
+    result = parent.recv() if parent.poll(600) else {"error": "timeout"}
+    proc.join()
+    return result
+
+
+def measure_import(workdir, samples=3):
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        pythonpath = os.pathsep.join(p for p in (ROOT, os.environ.get("PYTHONPATH")) if p)
+        proc = subprocess.run([sys.executable, "-c", "import app.main"], cwd=ROOT, env={**os.environ, "PYTHONPATH": pythonpath},
+                              check=False, capture_output=True, text=True)
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            # A failed import exits early and would look like a fast one.
+            return {"count": 0, "error": proc.stderr.strip().splitlines()[-1:] or ["exit %d" % proc.returncode]}
+        times.append(elapsed)
+    return percentiles(times)
+
+
+async def run_end_to_end(args):
+    import httpx
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    body = {"query": "Forecast the next quarter for TCS", "quarters": args.quarters}
+    stage_samples = {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        async def one():
+            start = time.perf_counter()
+            r = await client.post("/forecast", json=body)
+            elapsed = time.perf_counter() - start
+            r.raise_for_status()
+            for stage, seconds in (r.json().get("metadata", {}).get("timings") or {}).items():
+                stage_samples.setdefault(stage, []).append(seconds)
+            return elapsed
+
+        cold = await one()
+        sequential = [await one() for _ in range(args.requests)]
+
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def bounded():
+            async with sem:
+                return await one()
+
+        start = time.perf_counter()
+        concurrent = await asyncio.gather(*(bounded() for _ in range(args.requests)))
+        wall = time.perf_counter() - start
+
+    return {
+        "cold_ms": round(cold * 1000, 3),
+        "sequential": percentiles(sequential),
+        "concurrent": {
+            **percentiles(concurrent),
+            "concurrency": args.concurrency,
+            "throughput_rps": round(len(concurrent) / wall, 3) if wall else None,
+        },
+        "stages": {stage: percentiles(v) for stage, v in sorted(stage_samples.items())},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, baseline, threshold):
+    # Flags every p95 that got slower than baseline by more than `threshold`.
+    regressions = []
+
+    def walk(cur, base, path):
+        for key, value in cur.items():
+            if key not in base:
+                continue
+            if isinstance(value, dict):
+                walk(value, base[key], path + (key,))
+            elif key == "p95_ms" and base[key]:
+                ratio = value / base[key]
+                if ratio > 1 + threshold:
+                    regressions.append({"metric": ".".join(path + (key,)), "baseline": base[key], "current": value, "ratio": round(ratio, 3)})
+
+    walk(current, baseline, ())
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the forecasting pipeline.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--quarters", type=int, default=3)
+    parser.add_argument("--documents", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--pdf-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--stage-iterations", type=int, default=10)
+    parser.add_argument("--artifacts", action="store_true", help="run the refresh job first and serve from artifacts")
+    parser.add_argument("--cold", action="store_true", help="disable extraction and LLM caches for the end-to-end run")
+    parser.add_argument("--real-embeddings", action="store_true", help="load the real SentenceTransformer model")
+    parser.add_argument("--skip-stages", action="store_true")
+    parser.add_argument("--save", help="write results JSON here (e.g. a baseline)")
+    parser.add_argument("--compare", help="baseline JSON to compare p95 latencies against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+    args.save = os.path.abspath(args.save) if args.save else None
+    args.compare = os.path.abspath(args.compare) if args.compare else None
+
+    sys.path.insert(0, ROOT)
+    from bench.fixtures import write_fixtures
+    from bench.fakes import FakeServer
+
+    workdir = tempfile.mkdtemp(prefix="forecast-bench-")
+    documents = write_fixtures(os.path.join(workdir, "docs"), count=args.documents, pages=args.pages)
+    server = FakeServer(os.path.join(workdir, "docs"), documents, llm_latency=args.llm_latency_ms / 1000).start()
+
+    try:
+        # The app resolves data/ and its caches relative to the working directory.
+        os.chdir(workdir)
+        configure_env(workdir, server.base_url, args)
+        results = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+            "import": percentiles([]) if args.skip_stages else measure_import(workdir),
+        }
+
+        if not args.skip_stages:
+            results["stage_isolated"] = {s: run_stage(s, workdir, server.base_url, args) for s in STAGES}
+
+        install_fakes(args)
+        if args.artifacts:
+            from app.jobs.refresh import refresh
+            results["refresh"] = refresh(args.quarters)
+        results["end_to_end"] = asyncio.run(run_end_to_end(args))
+
+        from app.database.mysql_logger import shutdown_logger
+        from app.tools.financial_data_extractor import shutdown_extraction_pool
+        shutdown_logger()
+        shutdown_extraction_pool()
+    finally:
+        server.stop()
+        os.chdir(ROOT)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            results["regressions"] = compare(results, json.load(f), args.threshold)
+
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if results.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -17,3 +17,13 @@ CREATE TABLE IF NOT EXISTS raw_documents (
   content LONGTEXT,
   fetched_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+
+CREATE TABLE IF NOT EXISTS forecast_artifacts (
+  id INT AUTO_INCREMENT PRIMARY KEY,
+  artifact_key VARCHAR(255) NOT NULL UNIQUE,
+  kind VARCHAR(32) NOT NULL,
+  quarter VARCHAR(64),
+  content_hash VARCHAR(64),
+  payload LONGTEXT,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+import numpy as np
+
+from app.utils.append_store import AppendOnlyMatrix
+
+
+def _open(root):
+    return AppendOnlyMatrix(os.path.join(root, "rows.log"), os.path.join(root, "vectors.bin"), os.path.join(root, ".lock"))
+
+
+def test_rows_and_records_left_by_a_dead_writer_are_dropped():
+    root = tempfile.mkdtemp()
+    store = _open(root)
+    with store.locked():
+        store.read()
+        store.append(np.ones((2, 3)), [{"op": "put", "key": "a"}, {"op": "put", "key": "b"}])
+    # A writer died after its vectors and halfway through its log line.
+    with open(os.path.join(root, "vectors.bin"), "ab") as f:
+        f.write(np.full((5, 3), 9, np.float32).tobytes())
+    with open(os.path.join(root, "rows.log"), "ab") as f:
+        f.write(b'{"op": "put", "key": "z"')
+
+    reader = _open(root)
+    assert [r["key"] for r in reader.read()] == ["a", "b"]
+    with open(os.path.join(root, "rows.log"), "r+b") as f:
+        f.truncate(f.seek(0, os.SEEK_END) - len(b'{"op": "put", "key": "z"'))
+    with reader.locked():
+        reader.read()
+        reader.append(np.full((1, 3), 7), [{"op": "put", "key": "c"}])
+    assert reader.read() == [{"op": "put", "key": "c", "row": 2}]
+    assert reader.view()[2].tolist() == [7.0, 7.0, 7.0]
+    assert os.path.getsize(os.path.join(root, "vectors.bin")) == 3 * 3 * 4
@@ -0,0 +1,49 @@
+import os
+import tempfile
+
+from app.tools import financial_data_extractor as fx
+
+
+def _with_cache_dir(test):
+    def run():
+        saved = fx.CACHE_DIR, fx.CACHE_MAX_BYTES, fx.CACHE_ENABLED, dict(fx.METRIC_PATTERNS)
+        fx.CACHE_DIR, fx.CACHE_ENABLED = tempfile.mkdtemp(), True
+        try:
+            test()
+        finally:
+            fx.CACHE_DIR, fx.CACHE_MAX_BYTES, fx.CACHE_ENABLED = saved[:3]
+            fx.METRIC_PATTERNS.clear()
+            fx.METRIC_PATTERNS.update(saved[3])
+    run.__name__ = test.__name__
+    return run
+
+
+@_with_cache_dir
+def test_changing_metric_patterns_misses_metrics_but_keeps_text():
+    fx.cache_put("text", "abc", ["page one", "page two"])
+    fx.cache_put("metrics", "abc", {"metrics": {"net_profit": "200 crore"}})
+    assert fx.cache_get("metrics", "abc") == {"metrics": {"net_profit": "200 crore"}}
+
+    fx.METRIC_PATTERNS["ebitda"] = r"ebitda[^\d]{0,40}([\d,\.]+)"
+    assert fx.cache_get("metrics", "abc") is None
+    assert fx.cache_get("text", "abc") == ["page one", "page two"]
+
+
+@_with_cache_dir
+def test_eviction_drops_oldest_entries_until_under_the_limit():
+    fx.CACHE_MAX_BYTES = 10 ** 9
+    for i in range(5):
+        fx.cache_put("text", f"doc{i}", ["x" * 1000])
+        path = fx._cache_path("text", fx._cache_key(f"doc{i}", "text"))
+        os.utime(path, (1000 + i, 1000 + i))
+    size = os.path.getsize(path)
+
+    fx.CACHE_MAX_BYTES = 3 * size
+    fx.cache_put("text", "new", ["x" * 1000])
+
+    names = os.listdir(fx.CACHE_DIR)
+    assert sum(os.path.getsize(os.path.join(fx.CACHE_DIR, n)) for n in names) <= fx.CACHE_MAX_BYTES
+    assert fx.cache_get("text", "new") is not None
+    assert fx.cache_get("text", "doc4") is not None
+    assert fx.cache_get("text", "doc3") is not None
+    assert fx.cache_get("text", "doc0") is None and fx.cache_get("text", "doc2") is None
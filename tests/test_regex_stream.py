@@ -0,0 +1,51 @@
+import random
+
+from app.tools.financial_data_extractor import simple_regex_extract
+
+FRAGMENTS = [
+    "Total Revenue", "revenue", "Net Profit", "PAT", "Operating Margin", "operating",
+    " of ", " was ", " for the quarter ", ": ", " Rs ", "₹", " crore", " cr", " INR",
+    "12,345", "7.5", "26.1%", "2024", "%", ".", ",", " ", "\n", "margin", "net", "total",
+    "x" * 50, "y" * 150, "The board met on 12 Jan.",
+]
+
+
+def random_text(rng):
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 120)))
+
+
+def random_pages(rng, text):
+    cuts = sorted(rng.sample(range(len(text) + 1), k=min(len(text) + 1, rng.randint(0, 8))))
+    pages, prev = [], 0
+    for cut in cuts:
+        pages.append(text[prev:cut])
+        prev = cut
+    pages.append(text[prev:])
+    return "\n".join(pages), pages
+
+
+def test_streamed_pages_match_joined_text():
+    rng = random.Random(1234)
+    for _ in range(5000):
+        joined, pages = random_pages(rng, random_text(rng))
+        expected = simple_regex_extract(joined)
+        assert simple_regex_extract(iter(pages)) == expected
+        assert simple_regex_extract(iter(pages), stop_early=True) == expected
+
+
+def test_stop_early_leaves_remaining_pages_unread():
+    pages = [
+        "Total Revenue 1,000 crore and Net Profit 200 crore, operating margin 25.0%" + " " * 200,
+        "second page",
+        "third page",
+    ]
+    it = iter(pages)
+    result = simple_regex_extract(it, stop_early=True)
+    assert result == {"total_revenue": "1,000 crore", "net_profit": "200 crore", "operating_margin": "25.0%"}
+    assert list(it) == ["second page", "third page"]
+
+
+def test_without_stop_early_every_page_is_read():
+    it = iter(["Total Revenue 1,000 crore Net Profit 200 crore operating margin 25.0%" + " " * 200, "more", "end"])
+    simple_regex_extract(it)
+    assert list(it) == []
@@ -0,0 +1,17 @@
+import os
+
+from app.utils.scraper import _local_path
+
+
+def test_screener_links_get_distinct_paths_with_their_extension():
+    a = _local_path("https://www.bseindia.com/xml-data/corpfiling/AttachHis/AnnPdfOpen.aspx?Pname=111.pdf", "data")
+    b = _local_path("https://www.bseindia.com/xml-data/corpfiling/AttachHis/AnnPdfOpen.aspx?Pname=222.pdf", "data")
+    assert a != b
+    assert a.endswith(".pdf") and b.endswith(".pdf")
+    assert os.path.dirname(a) == "data"
+
+
+def test_plain_links_keep_their_name_and_extension():
+    path = _local_path("https://example.com/files/Q3_results.PDF", "data")
+    assert os.path.basename(path).startswith("Q3_results-") and path.endswith(".pdf")
+    assert path == _local_path("https://example.com/files/Q3_results.PDF", "data")
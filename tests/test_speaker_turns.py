@@ -0,0 +1,19 @@
+from app.tools.qualitative_rag_tool import speaker_turns
+
+TRANSCRIPT = """Welcome to the call.
+Moderator: Good evening.
+N. Chandrasekaran: Demand is strong.
+Note: figures are consolidated.
+Total Revenue: 60,000 crore.
+revenue growth: 5%
+Samir Seksaria: Margins improved."""
+
+
+def test_only_name_like_labels_start_a_turn():
+    assert [s for s, _ in speaker_turns(TRANSCRIPT)] == ["", "Moderator", "N. Chandrasekaran", "Samir Seksaria"]
+    assert "Total Revenue: 60,000 crore." in speaker_turns(TRANSCRIPT)[2][1]
+
+
+def test_roster_limits_speakers():
+    turns = speaker_turns(TRANSCRIPT, ["samir seksaria"])
+    assert [s for s, _ in turns] == ["", "samir seksaria"]
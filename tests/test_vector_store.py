@@ -0,0 +1,21 @@
+import tempfile
+
+import numpy as np
+
+from app.utils.vector_store import NumpyStore
+
+
+def test_writes_from_another_handle_and_compaction_are_visible():
+    root = tempfile.mkdtemp()
+    writer = NumpyStore(root).get_or_create_collection("c")
+    reader = NumpyStore(root).get_or_create_collection("c")
+    for r in range(30):
+        writer.upsert([f"id{i}" for i in range(100)], np.full((100, 3), r), metadatas=[{"r": r}] * 100)
+    assert writer.generation > 0
+    assert reader.count() == 100
+    assert reader.get(ids=["id5"])["metadatas"] == [{"r": 29}]
+    reader.delete(where={"r": 29})
+    writer.upsert(["new"], [[1.0, 0.0, 0.0]], documents=["doc"])
+    reopened = NumpyStore(root).get_or_create_collection("c")
+    assert reopened.count() == 1
+    assert reopened.query([[1.0, 0.0, 0.0]], n_results=5)["documents"] == [["doc"]]